@@ -0,0 +1,286 @@
+import re
+from array import array
+from tree import LABEL, TOKEN, ParserException, tree
+
+"""
+Array-backed trees for Newick files too big for one tree object per node.
+
+A CompactTree numbers its nodes in preorder (the root is node 0) and keeps them in four arrays of
+4 byte integers: the parent, first child, next sibling and label of every node (-1 for no node).
+Labels are interned - every distinct label is stored once, in one string, and a node holds the
+number of its label. That is 16 bytes a node plus the distinct labels, where a tree object with its
+children list costs a few hundred bytes. CompactNode views give the nodes the label/children API of
+tree, and str, len and write work like they do for tree.
+
+CompactTree.from_newick builds the arrays straight from the Newick text, with the same grammar and
+ParserExceptions as parse_newick, and CompactTree.from_tree converts a tree.
+"""
+
+class CompactTree:
+	"""
+	Struct-of-arrays tree. The variable instances for a compact tree are:
+	* parent, first_child, next_sibling: array of the parent, first child and next sibling of every node,
+	  -1 if there is none
+	* label_id: array of the number of the label of every node
+	* labels: the distinct labels, one after the other in one string
+	* label_offsets: array where label k is labels[label_offsets[k]:label_offsets[k + 1]]
+	"""
+
+	def __init__(self):
+		self.parent = array("i")
+		self.first_child = array("i")
+		self.next_sibling = array("i")
+		self.label_id = array("i")
+		self.labels = ""
+		self.label_offsets = array("q", [0])
+
+	@classmethod
+	def from_newick(cls, ts):
+		"""
+		Input:
+		* ts: a Newick string (see parse_newick)
+		Output:
+		* The CompactTree of ts, throwing the ParserException parse_newick would
+		"""
+		store = cls()
+		parent, first_child, next_sibling, label_id = store.parent, store.first_child, store.next_sibling, store.label_id
+		interned = {}
+		G = (match.group() for match in TOKEN.finditer(re.sub(r"\s+", "", ts)))
+
+		def new_node(above):
+			"""Appends a node as the last child of above (-1 for the root); returns its index"""
+			node = len(parent)
+			parent.append(above)
+			first_child.append(-1)
+			next_sibling.append(-1)
+			label_id.append(0)
+			if above >= 0:
+				if last_child[-1] < 0:
+					first_child[above] = node
+				else:
+					next_sibling[last_child[-1]] = node
+				last_child[-1] = node
+			return node
+
+		# same parser as tree.T, building nodes in preorder
+		current = next(G, "$")
+		if not (LABEL.match(current) or current == "("):
+			raise ParserException("Invalid first token.")
+		open_nodes = [] # every node whose ( isn't closed yet, innermost last
+		last_child = [] # the last child found so far of every open node
+		while True:
+			# S: a label, or a ( that starts a set of children
+			above = open_nodes[-1] if open_nodes else -1
+			if current == "(":
+				node = new_node(above)
+				current = next(G, "$")
+				if current != ")": # SLIST starts with an S
+					open_nodes.append(node)
+					last_child.append(-1)
+					continue
+				last_child.append(-1)
+				label_id[new_node(node)] = interned.setdefault("", len(interned)) # an empty set of children
+				last_child.pop()
+				closed = True
+			elif LABEL.match(current):
+				node = new_node(above)
+				label_id[node] = interned.setdefault(current, len(interned))
+				current = next(G, "$")
+				closed = False
+			else:
+				raise ParserException("S: Unrecognized token")
+
+			# a set of children is closed - the parent's label comes next
+			while True:
+				if closed:
+					current = next(G, "$")
+					if not LABEL.match(current): # a parent node must come after a set of children
+						raise ParserException("No parent after set of children - missing label")
+					label_id[node] = interned.setdefault(current, len(interned))
+					current = next(G, "$")
+				if not open_nodes:
+					break
+				if current == ",":
+					current = next(G, "$")
+					break
+				if current != ")":
+					raise ParserException("Missing closing ).")
+				node = open_nodes.pop()
+				last_child.pop()
+				closed = True
+			if not open_nodes:
+				break
+
+		if current != ";":
+			raise ParserException("No terminating semicolon.")
+		if next(G, "$") != "$":
+			raise ParserException("Symbols after teminating semicolon.")
+		store.set_labels(interned)
+		return store
+
+	@classmethod
+	def from_tree(cls, t):
+		"""Returns the CompactTree of the tree t (see tree.py)"""
+		store = cls()
+		parent, first_child, next_sibling, label_id = store.parent, store.first_child, store.next_sibling, store.label_id
+		interned = {}
+		last_child = array("i") # the last child numbered so far of every node
+		stack = [(t, -1)] # nodes still to be numbered, with the index of their parent
+		while stack:
+			node, above = stack.pop()
+			index = len(parent)
+			parent.append(above)
+			first_child.append(-1)
+			next_sibling.append(-1)
+			label_id.append(interned.setdefault(node.label, len(interned)))
+			last_child.append(-1)
+			if above >= 0:
+				if last_child[above] < 0:
+					first_child[above] = index
+				else:
+					next_sibling[last_child[above]] = index
+				last_child[above] = index
+			for child in reversed(node.children):
+				stack.append((child, index))
+		store.set_labels(interned)
+		return store
+
+	def set_labels(self, labels):
+		"""Stores the distinct labels, in the order of their numbers (a list, or a dictionary with them as keys), in labels and label_offsets"""
+		offsets = self.label_offsets
+		for label in labels:
+			offsets.append(offsets[-1] + len(label))
+		self.labels = "".join(labels)
+
+	def __len__(self):
+		return len(self.parent)
+
+	def label(self, node):
+		"""Returns the label of node"""
+		k = self.label_id[node]
+		return self.labels[self.label_offsets[k]:self.label_offsets[k + 1]]
+
+	def children(self, node):
+		"""Yields the children of node in order"""
+		child = self.first_child[node]
+		while child >= 0:
+			yield child
+			child = self.next_sibling[child]
+
+	def subtree_end(self, node):
+		"""Returns the index after the last node of the subtree of node (nodes are numbered in preorder)"""
+		while node >= 0:
+			if self.next_sibling[node] >= 0:
+				return self.next_sibling[node]
+			node = self.parent[node]
+		return len(self.parent)
+
+	def node(self, index):
+		"""Returns a CompactNode view of node index"""
+		return CompactNode(self, index)
+
+	@property
+	def root(self):
+		return CompactNode(self, 0)
+
+	def fragments(self, node = 0):
+		"""Yields the Newick string (without the ;) of the subtree of node a piece at a time, without recursion"""
+		first_child, next_sibling, parent = self.first_child, self.next_sibling, self.parent
+		top = node
+		while True:
+			while first_child[node] >= 0: # down to the first leaf
+				yield "("
+				node = first_child[node]
+			yield self.label(node)
+			while node != top and next_sibling[node] < 0: # close the subtrees that end here
+				node = parent[node]
+				yield ")" + self.label(node)
+			if node == top:
+				return
+			yield ","
+			node = next_sibling[node]
+
+	def to_tree(self, node = 0):
+		"""Returns the subtree of node as tree objects"""
+		nodes = {}
+		for index in range(self.subtree_end(node) - 1, node - 1, -1): # children before parents
+			nodes[index] = tree(self.label(index), [nodes.pop(child) for child in self.children(index)])
+		return nodes[node]
+
+	def strHelper(self):
+		return "".join(self.fragments())
+
+	def __str__(self):
+		return self.strHelper() + ";"
+
+	def __repr__(self):
+		return "CompactTree: " + str(self)
+
+	def write(self, out, buffer_size = 4096):
+		"""Same as tree.write"""
+		self.root.write(out, buffer_size)
+
+
+class CompactNode:
+	"""
+	View of one node of a CompactTree, with the label/children API of tree. The variable instances for
+	a compact node are:
+	* store: the CompactTree
+	* index: the number of the node in the store
+	"""
+
+	def __init__(self, store, index):
+		self.store = store
+		self.index = index
+
+	@property
+	def label(self):
+		return self.store.label(self.index)
+
+	@property
+	def children(self):
+		return [CompactNode(self.store, child) for child in self.store.children(self.index)]
+
+	@property
+	def parent(self):
+		above = self.store.parent[self.index]
+		return None if above < 0 else CompactNode(self.store, above)
+
+	def isLeaf(self):
+		return self.store.first_child[self.index] < 0
+
+	def __len__(self):
+		return self.store.subtree_end(self.index) - self.index
+
+	def __eq__(self, other):
+		return isinstance(other, CompactNode) and self.store is other.store and self.index == other.index
+
+	def __hash__(self):
+		return hash((id(self.store), self.index))
+
+	def fragments(self):
+		return self.store.fragments(self.index)
+
+	def strHelper(self):
+		return "".join(self.fragments())
+
+	def __str__(self):
+		return self.strHelper() + ";"
+
+	def __repr__(self):
+		return "CompactNode: " + str(self)
+
+	def write(self, out, buffer_size = 4096):
+		"""Same as tree.write"""
+		buffer = []
+		for fragment in self.fragments():
+			buffer.append(fragment)
+			if len(buffer) >= buffer_size:
+				out.write("".join(buffer))
+				buffer.clear()
+		buffer.append(";")
+		out.write("".join(buffer))
+
+	def to_tree(self):
+		"""Returns the subtree of the node as tree objects"""
+		return self.store.to_tree(self.index)
@@ -0,0 +1,156 @@
+import mmap
+import os
+import re
+import struct
+import sys
+from array import array
+from tree import parse_newick
+
+"""
+Random access to files of many ;-terminated Newick trees.
+
+A NewickCorpus memory maps the file and finds where every tree ends in one pass over it. corpus[i]
+parses tree i only when it is asked for, and corpus[a:b] is a CorpusView that does the same for its
+trees, so scanning or sampling a corpus never loads it whole. The
+index of tree ends is saved next to the file (corpus.nwk -> corpus.nwk.nwi) and used the next time
+the file is opened, as long as the file's size and modification time haven't changed.
+"""
+
+# Index files: a header, then the end offset (the position after the ;) of every tree as 8 byte ints,
+# in the byte order of the machine that wrote them.
+INDEX_SUFFIX = ".nwi"
+INDEX_MAGIC = b"NWKINDEX" if sys.byteorder == "little" else b"XEDNIKWN"
+INDEX_VERSION = 1
+INDEX_HEADER = struct.Struct("=8sIQQq") # magic, version, tree count, source size, source modification time (ns)
+
+class NewickCorpus:
+	"""
+	The trees of a Newick file, parsed as they are used. The variable instances for a corpus are:
+	* path: the Newick file
+	* parser: the function that parses the text of a tree - parse_newick, or e.g. CompactTree.from_newick
+	* data: the memory mapped file
+	* stamp: size and modification time (ns) of the file when it was opened - an index file is only used if
+	  it was saved with the same stamp
+	* ends: end offset of every tree (array of 8 byte ints) - tree i is data[ends[i - 1]:ends[i]].
+	  Text after the last ; that isn't whitespace counts as one more tree (which doesn't parse).
+	"""
+
+	def __init__(self, path, parser = parse_newick, save_index = True):
+		"""
+		Input:
+		* path: a file of Newick trees
+		* parser: the function used by corpus[i] to parse a tree
+		* save_index: save the index of tree ends next to the file (see INDEX_SUFFIX) if it had to be built
+		"""
+		self.path = path
+		self.parser = parser
+		with open(path, "rb") as fp:
+			stat = os.fstat(fp.fileno())
+			self.data = mmap.mmap(fp.fileno(), 0, access = mmap.ACCESS_READ) if stat.st_size else b""
+		self.stamp = stat.st_size, stat.st_mtime_ns
+		self.ends = self.load_index()
+		if self.ends is None:
+			self.ends = tree_ends(self.data)
+			if save_index:
+				self.save_index()
+
+	def index_path(self):
+		return str(self.path) + INDEX_SUFFIX
+
+	def load_index(self):
+		"""Returns the tree ends saved in the index file, or None if there is none or it is stale or damaged"""
+		try:
+			with open(self.index_path(), "rb") as fp:
+				data = fp.read()
+		except OSError:
+			return None
+		if len(data) < INDEX_HEADER.size or data[:len(INDEX_MAGIC)] != INDEX_MAGIC:
+			return None
+		magic, version, count, size, mtime = INDEX_HEADER.unpack_from(data)
+		if version != INDEX_VERSION or (size, mtime) != self.stamp or len(data) != INDEX_HEADER.size + 8 * count:
+			return None
+		ends = array("q")
+		ends.frombytes(data[INDEX_HEADER.size:])
+		return ends
+
+	def save_index(self):
+		"""
+		Saves the tree ends to the index file, through a temporary file so readers never see a half written
+		index. An unwritable directory is ignored - it only costs a rebuild.
+		"""
+		path = self.index_path()
+		temp = path + "." + str(os.getpid())
+		try:
+			with open(temp, "wb") as fp:
+				fp.write(INDEX_HEADER.pack(INDEX_MAGIC, INDEX_VERSION, len(self.ends), *self.stamp))
+				fp.write(array("q", self.ends).tobytes())
+			os.replace(temp, path)
+		except OSError:
+			pass
+
+	def __len__(self):
+		return len(self.ends)
+
+	def text(self, i):
+		"""Returns the Newick text of tree i (with the whitespace around it)"""
+		if i < 0:
+			i += len(self.ends)
+		if not 0 <= i < len(self.ends):
+			raise IndexError("corpus index out of range")
+		start = self.ends[i - 1] if i else 0
+		return str(self.data[start:self.ends[i]], "utf-8")
+
+	def __getitem__(self, i):
+		"""Returns tree i parsed by the corpus parser, throwing its ParserException (a CorpusView for a slice)"""
+		if isinstance(i, slice):
+			return CorpusView(self, range(len(self.ends))[i])
+		return self.parser(self.text(i))
+
+	def __iter__(self):
+		for i in range(len(self.ends)):
+			yield self[i]
+
+	def close(self):
+		if isinstance(self.data, mmap.mmap):
+			self.data.close()
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *exc):
+		self.close()
+
+class CorpusView:
+	"""
+	Some of the trees of a NewickCorpus, parsed as they are used like the corpus's own. The variable instances for
+	a corpus view are:
+	* corpus: the NewickCorpus
+	* numbers: range of the numbers of the trees in the corpus - view[k] is corpus[numbers[k]]
+	"""
+
+	def __init__(self, corpus, numbers):
+		self.corpus = corpus
+		self.numbers = numbers
+
+	def __len__(self):
+		return len(self.numbers)
+
+	def text(self, k):
+		return self.corpus.text(self.numbers[k])
+
+	def __getitem__(self, k):
+		if isinstance(k, slice):
+			return CorpusView(self.corpus, self.numbers[k])
+		return self.corpus[self.numbers[k]]
+
+	def __iter__(self):
+		for i in self.numbers:
+			yield self.corpus[i]
+
+def tree_ends(data):
+	"""Returns an array of the end offset (past the ;) of every tree in data, a bytes-like Newick corpus"""
+	ends = array("q", [match.end() for match in re.finditer(b";", data)])
+	last = ends[-1] if ends else 0
+	if data[last:].strip(): # an unterminated tree at the end
+		ends.append(len(data))
+	return ends
@@ -9,28 +9,83 @@ class tree:
 		return self.strHelper() + ";"
 
 	def strHelper(self):
-		if not self.children:
-			return self.label
-		newick_string = "("
-		for index, child in enumerate(self.children, 1): #starting at 1 saves an add operation per loop
-			if index != len(self.children):
-				newick_string += child.strHelper() + ","
+		return "".join(self.fragments())
+
+	def fragments(self):
+		"""
+		Yields the Newick string of the tree (without the ;) a piece at a time. The nodes still to be written
+		are kept on an explicit stack, so deep trees don't hit the recursion limit.
+		"""
+		stack = [self]
+		while stack:
+			node = stack.pop()
+			if type(node) is str: # a , or the ) and label that close a set of children
+				yield node
+			elif not node.children:
+				yield node.label
 			else:
-				newick_string += child.strHelper()
-		newick_string += ")" + self.label
-		return newick_string
+				yield "("
+				stack.append(")" + node.label)
+				for index in range(len(node.children) - 1, 0, -1):
+					stack.append(node.children[index])
+					stack.append(",")
+				stack.append(node.children[0])
+
+	def write(self, out, buffer_size = 4096):
+		"""
+		Input:
+		* out: a file object (or io.StringIO) opened for text
+		* buffer_size: the number of pieces (see fragments) joined into one out.write call
+		Output:
+		* Writes str(self) to out without building the whole string in memory
+		"""
+		buffer = []
+		for fragment in self.fragments():
+			buffer.append(fragment)
+			if len(buffer) >= buffer_size:
+				out.write("".join(buffer))
+				buffer.clear()
+		buffer.append(";")
+		out.write("".join(buffer))
 
 	def __repr__(self):
 		return "Tree: " + str(self)
 
 	def __len__(self):
-		count = 1
-		for node in self.children:
-			count += len(node)
+		count = 0
+		stack = [self] # counted without recursion, so deep trees don't hit the recursion limit
+		while stack:
+			node = stack.pop()
+			count += 1
+			stack.extend(node.children)
 		return count
 
 	def isLeaf(self):
-		return len(self.children) == 0
+		return not self.children
+
+	def subtree_sizes(self):
+		"""
+		Returns a dictionary from every node of the tree to len(node), counted in one pass without recursion.
+		It is a snapshot: code that calls len() on many subtrees of a tree that isn't changing can look the
+		sizes up in it instead, but it isn't updated when the tree changes.
+		"""
+		sizes = {}
+		stack = [(self, False)]
+		while stack:
+			node, counted = stack.pop()
+			if counted:
+				size = 1
+				for child in node.children:
+					size += sizes[child]
+				sizes[node] = size
+			else:
+				stack.append((node, True))
+				for child in node.children:
+					if child.children:
+						stack.append((child, False))
+					else:
+						sizes[child] = 1
+		return sizes
 
 
 
@@ -44,68 +99,71 @@ class ParserException(Exception):
 	def __str__(self):
 		return self.msg
 
-# ts is the token stream - in this case just a string and the lexar is yielding 1 char at a time
+# ts is the token stream - the lexer returns an iterator of whole labels (runs of alphanumeric characters) and every
+# other character on its own, all found in one regex pass over the string with its whitespace removed
+TOKEN = re.compile(r"\w+|.", re.DOTALL)
+LABEL = re.compile(r"\w")
+
 def lexer(ts):
-	for char in re.sub("\s+", "", ts):
-		yield char
-	yield "$" # End of Input char - states EOI
+	tokens = TOKEN.findall(re.sub(r"\s+", "", ts))
+	tokens.append("$") # End of Input char - states EOI
+	return iter(tokens)
 
 # terminal set: a-zA-Z0-9,)(;
+# Grammar: T -> S;  S -> \w+ | (SLIST)\w+  SLIST -> S {, S}
+# The parser keeps an explicit stack of the children of every open ( instead of recursing through
+# S and SLIST, so a tree as deep as its input can be parsed in constant Python stack depth.
 def parse_newick(ts):
 	G = lexer(ts)
 	try:
 		current, t = T(next(G), G)
-		if current != "$":
+		if next(G) != "$":
 			raise ParserException("Symbols after teminating semicolon.")
 		return t
 	except ParserException as pe:
 		raise pe #replace "raise pe" with "return pe.msg" to use my tester.py. I had to throw the error for your unit tests to work
 
 def T(current, G):
-	if re.match("\w+", current) or current == "(":
-		current, t = S(current, G)
-		if current != ";":
-			raise ParserException("No terminating semicolon.")
-	else:
+	"""Parses a tree starting with the token current; returns the ; after it and the tree"""
+	if not (LABEL.match(current) or current == "("):
 		raise ParserException("Invalid first token.")
-	return next(G), t
-
-def S(current, G):
-	if re.match("\w+", current):
-		label = current
-		while True:
+	open_children = [] # children of every ( not closed yet, innermost last
+	while True:
+		# S: a label, or a ( that starts a set of children
+		if current == "(":
 			current = next(G)
-			if re.match("\w+", current):
-				label += current
-			else:
-				return current, tree(label)
-
-	if current == '(':
-		current, children = SLIST(next(G), G)
-		if current != ')':
-			raise ParserException("Missing closing ).")
-		current = next(G)
-		if not re.match("\w+", current): # a parent node must come after a set of children
-			raise ParserException("No parent after set of children - missing label")
-		current, t = S(current, G)
-		for child in children:
-			t.children.append(child)
-
-	else:
-		raise ParserException("S: Unrecognized token")
-
-	return current, t
-
-def SLIST(current, G):
-	if current == ')':
-		return current, tree("")
+			if current != ")": # SLIST starts with an S
+				open_children.append([])
+				continue
+			children = [tree("")] # an empty set of children
+		elif LABEL.match(current):
+			t = tree(current)
+			current = next(G)
+			children = None
+		else:
+			raise ParserException("S: Unrecognized token")
 
-	children = []
-	while True:
-		current, child = S(current, G)
-		children.append(child)
-		if current != ',':
+		# a set of children is closed - the parent's label comes next
+		while True:
+			if children is not None:
+				current = next(G)
+				if not LABEL.match(current): # a parent node must come after a set of children
+					raise ParserException("No parent after set of children - missing label")
+				t = tree(current, children)
+				current = next(G)
+			if not open_children:
+				break
+			# t is the next child of the innermost (
+			open_children[-1].append(t)
+			if current == ",":
+				current = next(G)
+				break
+			if current != ")":
+				raise ParserException("Missing closing ).")
+			children = open_children.pop()
+		if not open_children:
 			break
-		current = next(G)
 
-	return current, children
\ No newline at end of file
+	if current != ";":
+		raise ParserException("No terminating semicolon.")
+	return current, t
@@ -0,0 +1,175 @@
+from compact_tree import CompactTree
+from newick_corpus import INDEX_SUFFIX, NewickCorpus
+from tree import *
+import io
+import os
+import tempfile
+import unittest
+import vector_newick
+
+class tree_tester(unittest.TestCase):
+
+	def depth(self, t):
+		"""Depth of the first-child path of t. (Helper function -- not a unit test.)"""
+		depth = 0
+		while t.children:
+			t = t.children[0]
+			depth += 1
+		return depth
+
+	def test01_parse(self):
+		"""parse_newick builds the same trees as before"""
+		t = parse_newick("((a,b,c)d, (e,f)g)h;")
+		self.assertEqual(t.strHelper(), "((a,b,c)d,(e,f)g)h")
+		self.assertEqual([child.label for child in t.children], ["d", "g"])
+		self.assertEqual(parse_newick("(a,bc9)d;").children[1].label, "bc9")
+		t = parse_newick("()a;")
+		self.assertEqual((t.label, len(t.children), t.children[0].label), ("a", 1, ""))
+
+	def test02_exceptions(self):
+		"""parse_newick throws the same messages as before"""
+		cases = [("a", "No terminating semicolon."), ("a,b,c,d;", "No terminating semicolon."),
+				 ("(a,b,cd;", "Missing closing )."), ("(*,b)c;", "S: Unrecognized token"),
+				 ("(a,*)c;", "S: Unrecognized token"), ("(a,b);", "No parent after set of children - missing label"),
+				 ("(a,b)d;a", "Symbols after teminating semicolon."), (";", "Invalid first token."), ("", "Invalid first token.")]
+		for s, msg in cases:
+			with self.assertRaises(ParserException) as error:
+				parse_newick(s)
+			self.assertEqual(str(error.exception), msg)
+
+	def test03_lexer(self):
+		"""lexer yields whole labels and single punctuation characters"""
+		self.assertEqual(list(lexer("((a1, b_2)c  d,*)e;")), ["(", "(", "a1", ",", "b_2", ")", "cd", ",", "*", ")", "e", ";", "$"])
+		self.assertEqual(list(lexer("")), ["$"])
+		label = "x" * 100000
+		self.assertEqual(parse_newick("(%s,b)%s;" % (label, label)).children[0].label, label)
+
+	def test04_deep(self):
+		"""parse_newick handles trees far deeper than the recursion limit"""
+		n = 200000
+		t = parse_newick("(" * n + "a" + ")b" * n + ";")
+		self.assertEqual(self.depth(t), n)
+		t = parse_newick("(" * n + "a,c" + ")b" * n + ";")
+		self.assertEqual(self.depth(t), n)
+		with self.assertRaises(ParserException):
+			parse_newick("(" * n + "a" + ")b" * (n - 1) + ";")
+
+	def test05_serialize(self):
+		"""str and write give the same Newick string, for wide and deep trees"""
+		for s in ["a;", "(a,b,c)d;", "((a,b,c)d,(e,f)g)h;", "(()a,b)c;"]:
+			t = parse_newick(s)
+			out = io.StringIO()
+			t.write(out, buffer_size = 2)
+			self.assertEqual((str(t), out.getvalue()), (s, s))
+		n = 200000
+		s = "(" * n + "a,c" + ")b" * n + ";"
+		self.assertEqual(str(parse_newick(s)), s)
+		s = "(" + ",".join(map(str, range(n))) + ")r;"
+		out = io.StringIO()
+		parse_newick(s).write(out)
+		self.assertEqual(out.getvalue(), s)
+
+	def test06_len(self):
+		"""len counts the tree as it is now, and subtree_sizes gives the size of every subtree in one pass"""
+		t = parse_newick("((a,b)c,d)e;")
+		self.assertEqual(len(t), 5)
+		t.children[0].children[0].children.append(tree("x")) # the way the parsers build trees
+		self.assertEqual((len(t), len(t.children[0])), (6, 4))
+		t.children[0].children.pop()
+		self.assertEqual(len(t), 5)
+		t = parse_newick("((a,b,c)d,(e,f)g)h;")
+		sizes = t.subtree_sizes()
+		self.assertEqual(len(sizes), 8)
+		nodes = [t]
+		while nodes:
+			node = nodes.pop()
+			self.assertEqual(sizes[node], len(node))
+			nodes.extend(node.children)
+		self.assertTrue(t.children[0].children[0].isLeaf() and not t.isLeaf())
+		n = 200000
+		t = parse_newick("(" * n + "a,c" + ")b" * n + ";")
+		self.assertEqual((len(t), t.subtree_sizes()[t]), (n + 2, n + 2))
+
+	def test07_compact(self):
+		"""CompactTree stores the same tree as parse_newick, and its views have the same API"""
+		s = "((a,b,c)d,(e,f)g,()a)h;"
+		c = CompactTree.from_newick(s)
+		self.assertEqual((str(c), str(CompactTree.from_tree(parse_newick(s))), str(c.to_tree())), (s, s, s))
+		self.assertEqual(list(c.parent), [-1, 0, 1, 1, 1, 0, 5, 5, 0, 8])
+		self.assertEqual(c.labels, "abcdefgh") # labels are interned - a is stored once
+		d = c.root.children[0]
+		self.assertEqual((d.label, [child.label for child in d.children], len(d), len(c.root), str(d)), ("d", ["a", "b", "c"], 4, 10, "(a,b,c)d;"))
+		self.assertTrue(d.children[0].isLeaf() and not d.isLeaf() and d.parent == c.root)
+		out = io.StringIO()
+		c.write(out, buffer_size = 2)
+		self.assertEqual(out.getvalue(), s)
+		for s in ["(a,b);", "(a,b)d;a", "(a,b,cd;"]:
+			with self.assertRaises(ParserException):
+				CompactTree.from_newick(s)
+		n = 200000
+		s = "(" * n + "a,c" + ")b" * n + ";"
+		c = CompactTree.from_newick(s)
+		self.assertEqual((len(c), str(c)), (n + 2, s))
+
+	@unittest.skipUnless(vector_newick.numpy, "needs NumPy")
+	def test08_vector_newick(self):
+		"""load_newick builds the same CompactTree as from_newick, and hands the strings it can't load to it"""
+		for s in ["a;", "(a,b,c)d;", "((a,b,c)d, (e,f)g,()a)h;\n", "(((x_1)y)z,(w)v)u;"]:
+			self.assertIsNotNone(vector_newick.structure(s))
+			c, v = CompactTree.from_newick(s), vector_newick.load_newick(s)
+			for column in ["parent", "first_child", "next_sibling", "label_id", "label_offsets"]:
+				self.assertEqual(list(getattr(c, column)), list(getattr(v, column)))
+			self.assertEqual(c.labels, v.labels)
+		for s in ["(é,b)c;", "(a,b)c;$"]: # not handled by the array passes
+			self.assertIsNone(vector_newick.structure(s))
+			self.assertEqual(str(vector_newick.load_newick(s)), str(parse_newick(s)))
+		for s in ["(a,b);", "a,b;", "(a,b)c;a", "((a,b)c;", "(a)b)c;", ""]:
+			with self.assertRaises(ParserException) as error:
+				vector_newick.load_newick(s)
+			with self.assertRaises(ParserException) as expected:
+				parse_newick(s)
+			self.assertEqual(str(error.exception), str(expected.exception))
+		n = 200000
+		s = "(" * n + "a,c" + ")b" * n + ";"
+		self.assertEqual(str(vector_newick.load_newick(s)), s)
+
+	def test09_corpus(self):
+		"""NewickCorpus parses the trees of a file one at a time, and saves its index next to the file"""
+		trees = ["((a,b,c)d,(e,f)g)h;", "a;", "(x,y)z;"] * 100
+		with tempfile.TemporaryDirectory() as directory:
+			path = os.path.join(directory, "corpus.nwk")
+			with open(path, "w") as fp:
+				fp.write("\n".join(trees) + "\n")
+			with NewickCorpus(path) as corpus:
+				self.assertEqual(len(corpus), 300)
+				self.assertEqual([str(corpus[i]) for i in (0, 1, 299, -2)], ["((a,b,c)d,(e,f)g)h;", "a;", "(x,y)z;", "a;"])
+				self.assertEqual(list(map(str, corpus[3:6])), trees[3:6])
+				self.assertEqual(list(map(str, corpus)), trees)
+				with self.assertRaises(IndexError):
+					corpus[300]
+			self.assertTrue(os.path.exists(path + INDEX_SUFFIX))
+			parsed = []
+			with NewickCorpus(path, parser = lambda text: parsed.append(text) or parse_newick(text)) as corpus:
+				view = corpus[10:290:7] # slices are views - nothing is parsed until it is used
+				self.assertEqual((len(view), parsed), (40, []))
+				self.assertEqual((str(view[1]), str(view[-1]), list(map(str, view[2:4]))), (trees[17], trees[283], trees[24:32:7]))
+				self.assertEqual(len(parsed), 4)
+				with self.assertRaises(IndexError):
+					view[40]
+			with NewickCorpus(path, parser = CompactTree.from_newick) as corpus, NewickCorpus(path, save_index = False) as fresh:
+				self.assertEqual(list(corpus.ends), list(fresh.ends))
+				self.assertEqual((len(corpus[0]), str(corpus[2])), (8, "(x,y)z;"))
+			with open(path, "a") as fp: # the saved index is stale now
+				fp.write("(a,b)c;\n(d,e")
+			with NewickCorpus(path) as corpus:
+				self.assertEqual((len(corpus), str(corpus[300])), (302, "(a,b)c;"))
+				with self.assertRaises(ParserException):
+					corpus[301]
+			with open(path + INDEX_SUFFIX, "wb") as fp: # a damaged index is rebuilt
+				fp.write(b"junk")
+			with NewickCorpus(path) as corpus:
+				self.assertEqual(len(corpus), 302)
+
+
+if __name__ == "__main__":
+	unittest.main()
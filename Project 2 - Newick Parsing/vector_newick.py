@@ -0,0 +1,157 @@
+import string
+from compact_tree import CompactTree
+
+try:
+	import numpy
+except ImportError: # every tree is loaded by CompactTree.from_newick instead
+	numpy = None
+
+"""
+Bulk Newick loader with NumPy.
+
+load_newick finds the structure of a Newick string with array passes instead of a loop over its
+tokens. The string becomes a byte array, whitespace is dropped, and the tokens are the punctuation
+characters and the starts of label runs. The nesting depth of every token is the cumulative sum of
+( = +1 and ) = -1. A node's parent is the last ( before it whose depth is the node's own depth,
+and the label of a ( node comes right after the first ) that closes its depth. Both are found for
+every node at once with a sort and a binary search. The arrays fill a CompactTree directly.
+
+The grammar is checked on the arrays too (which token can follow which, and where the depth can
+reach 0). Strings the fast path doesn't handle - invalid trees, non-ASCII labels, $ - are given to
+CompactTree.from_newick, so the result and the ParserExceptions are always those of parse_newick.
+"""
+
+WORD_CHARS = string.ascii_letters + string.digits + "_"
+
+# token kinds
+LABEL, OPEN, CLOSE, COMMA, SEMICOLON, WHITESPACE, OTHER = range(7)
+
+def byte_table():
+	"""Returns the token kind of every byte"""
+	table = [OTHER] * 256
+	for code in range(128):
+		char = chr(code)
+		if char in WORD_CHARS:
+			table[code] = LABEL
+		elif char.isspace():
+			table[code] = WHITESPACE
+	table[ord("(")], table[ord(")")], table[ord(",")], table[ord(";")] = OPEN, CLOSE, COMMA, SEMICOLON
+	return table
+
+BYTE_TABLE = byte_table()
+
+# FOLLOWS[a][b]: token kind b can come right after token kind a
+FOLLOWS = [[False, False, True, True],  # label: ) or ,
+		   [True, True, True, False],   # (: label, ( or ) (an empty set of children)
+		   [True, False, False, False], # ): the parent's label
+		   [True, True, False, False]]  # ,: label or (
+
+def load_newick(ts):
+	"""
+	Input:
+	* ts: a Newick string (see parse_newick)
+	Output:
+	* The CompactTree of ts (the same tree as CompactTree.from_newick(ts)), throwing the ParserException
+	  parse_newick would
+	"""
+	if numpy is None:
+		return CompactTree.from_newick(ts)
+	store = structure(ts)
+	return CompactTree.from_newick(ts) if store is None else store
+
+def structure(ts):
+	"""Returns the CompactTree of ts, or None if ts isn't a tree the array passes handle"""
+	try:
+		data = numpy.frombuffer(ts.encode("ascii"), dtype = numpy.uint8)
+	except UnicodeEncodeError:
+		return None
+	kinds = numpy.array(BYTE_TABLE, dtype = numpy.int8)[data]
+	if (kinds == OTHER).any():
+		return None
+	keep = kinds != WHITESPACE
+	kinds, stripped = kinds[keep], data[keep]
+	if len(kinds) == 0 or kinds[-1] != SEMICOLON or (kinds[:-1] == SEMICOLON).any():
+		return None
+	kinds, stripped = kinds[:-1], stripped[:-1] # the ; is the last token
+
+	# tokens: every punctuation character, and the first character of every label
+	word = kinds == LABEL
+	starts = numpy.flatnonzero(~word | numpy.concatenate(([True], ~word[:-1])))
+	tokens = kinds[starts].astype(numpy.int64)
+	n = len(tokens)
+	if n == 0 or tokens[0] not in (LABEL, OPEN) or tokens[-1] != LABEL:
+		return None
+	if n > 1 and not numpy.array(FOLLOWS, dtype = bool)[tokens[:-1], tokens[1:]].all():
+		return None
+	depth = numpy.cumsum((tokens == OPEN).astype(numpy.int64) - (tokens == CLOSE))
+	# every token but the last label (and the ) right before it) is inside the root's ( )
+	inside = depth[:-1] >= 1
+	if n > 1 and tokens[-2] == CLOSE:
+		inside[-1] = True
+	if depth[-1] != 0 or not inside.all():
+		return None
+
+	# nodes, in preorder: every (, every label that isn't a parent's label, and the empty child of every ()
+	previous = numpy.concatenate(([COMMA], tokens[:-1]))
+	opens = tokens == OPEN
+	empty = (tokens == CLOSE) & (previous == OPEN)
+	is_node = opens | (tokens == LABEL) & (previous != CLOSE) | empty
+	node_tokens = numpy.flatnonzero(is_node)
+	count = len(node_tokens)
+
+	# the parent of a node is the last ( before it whose depth is the depth before the node (the depth of
+	# the node itself for a label, and of the ( just before it for the empty child of a ())
+	level = depth[node_tokens] - opens[node_tokens] + empty[node_tokens]
+	open_tokens = numpy.flatnonzero(opens)
+	width = n + 1
+	open_keys = depth[open_tokens] * width + open_tokens # sorted by depth, then position
+	order = numpy.argsort(open_keys, kind = "stable")
+	open_keys, open_tokens = open_keys[order], open_tokens[order]
+	node_of_token = numpy.cumsum(is_node) - 1
+	parent = numpy.full(count, -1, dtype = numpy.int64)
+	inner = level > 0 # every node but the root
+	found = numpy.searchsorted(open_keys, level[inner] * width + node_tokens[inner]) - 1
+	parent[inner] = node_of_token[open_tokens[found]]
+
+	# the label of a ( node is the token after the first ) after it that leaves its depth
+	close_tokens = numpy.flatnonzero(tokens == CLOSE)
+	close_keys = (depth[close_tokens] + 1) * width + close_tokens
+	order = numpy.argsort(close_keys, kind = "stable")
+	close_keys, close_tokens = close_keys[order], close_tokens[order]
+	label_tokens = node_tokens.copy()
+	node_opens = opens[node_tokens]
+	open_nodes = node_tokens[node_opens]
+	label_tokens[node_opens] = close_tokens[numpy.searchsorted(close_keys, depth[open_nodes] * width + open_nodes)] + 1
+
+	# labels: the label runs (split out of the string with every other character made a space), interned in
+	# the order they first appear
+	words = numpy.where(word, stripped, ord(" ")).astype(numpy.uint8).tobytes().split()
+	ids = {label: index for index, label in enumerate(dict.fromkeys(words))}
+	word_ids = numpy.fromiter(map(ids.__getitem__, words), dtype = numpy.int64, count = len(words))
+	labels = [label.decode("ascii") for label in ids]
+	word_rank = numpy.cumsum(tokens == LABEL) - 1
+	node_empty = empty[node_tokens]
+	empty_id = -1
+	if node_empty.any(): # the empty label is interned between the labels before and after the first ()
+		before = word_rank[node_tokens[node_empty][0]] + 1
+		empty_id = int(word_ids[:before].max()) + 1 if before else 0
+		word_ids += word_ids >= empty_id
+		labels.insert(empty_id, "")
+	label_id = numpy.where(node_empty, empty_id, word_ids[word_rank[label_tokens] * ~node_empty])
+
+	# first child and next sibling from the parents: nodes are in preorder, so the first child of a node is the
+	# node right after it, and a node's next sibling is the next node with the same parent
+	first_child = numpy.full(count, -1, dtype = numpy.int64)
+	has_first = numpy.flatnonzero(parent[1:] == numpy.arange(count - 1)) + 1
+	first_child[has_first - 1] = has_first
+	next_sibling = numpy.full(count, -1, dtype = numpy.int64)
+	by_parent = numpy.argsort(parent, kind = "stable")
+	same = parent[by_parent[1:]] == parent[by_parent[:-1]]
+	next_sibling[by_parent[:-1][same]] = by_parent[1:][same]
+
+	store = CompactTree()
+	for column, values in ((store.parent, parent), (store.first_child, first_child),
+						   (store.next_sibling, next_sibling), (store.label_id, label_id)):
+		column.frombytes(values.astype(numpy.int32).tobytes())
+	store.set_labels(labels)
+	return store
@@ -5,7 +5,8 @@ import code_generator
 
 def compiler(source, tokens, output):
 	t, s = MLparser.parser(source, tokens)
-	print(t)
+	t.write(sys.stdout) # the AST, streamed a piece at a time
+	print()
 	outfile = open(output, "w")
 
 	stringLitList = {}
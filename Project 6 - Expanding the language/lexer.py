@@ -1,6 +1,12 @@
 import re
 import sys
 
+# An ML string literal is a quote, any mix of word characters, whitespace and backslashes, then a quote.
+# The STRINGLIT regex for that, STRING_REGEX, backtracks exponentially on an unterminated literal, so the
+# lexer matches it with FLAT_STRING_REGEX instead: the same literals, in time linear in their length.
+STRING_REGEX = r'(\"(\w*\s*\\*)*\")'
+FLAT_STRING_REGEX = r'("[\w\s\\]*")'
+
 class LexerError(Exception):
 	"""
 	Exception to be thrown when the lexer encounters a bad token.
@@ -73,7 +79,7 @@ def lexer(source_file, token_file):
 		def_arr = definition.split()
 		classes.append(def_arr[0])
 		names.append(def_arr[1])
-		regexs.append(def_arr[2])
+		regexs.append(FLAT_STRING_REGEX if def_arr[1] == "STRINGLIT" and def_arr[2] == STRING_REGEX else def_arr[2])
 
 	src = open(source_file, "r")
 	for linenum, line in enumerate(src, 1): #1 is start index for the enumeration
@@ -10,28 +10,83 @@ class tree:
 		return self.strHelper() + ";"
 
 	def strHelper(self):
-		if not self.children:
-			return self.label
-		newick_string = "("
-		for index, child in enumerate(self.children, 1): #starting at 1 saves an add operation per loop
-			if index != len(self.children):
-				newick_string += child.strHelper() + ","
+		return "".join(self.fragments())
+
+	def fragments(self):
+		"""
+		Yields the Newick string of the tree (without the ;) a piece at a time. The nodes still to be written
+		are kept on an explicit stack, so deep trees don't hit the recursion limit.
+		"""
+		stack = [self]
+		while stack:
+			node = stack.pop()
+			if type(node) is str: # a , or the ) and label that close a set of children
+				yield node
+			elif not node.children:
+				yield node.label
 			else:
-				newick_string += child.strHelper()
-		newick_string += ")" + self.label
-		return newick_string
+				yield "("
+				stack.append(")" + node.label)
+				for index in range(len(node.children) - 1, 0, -1):
+					stack.append(node.children[index])
+					stack.append(",")
+				stack.append(node.children[0])
+
+	def write(self, out, buffer_size = 4096):
+		"""
+		Input:
+		* out: a file object (or io.StringIO) opened for text
+		* buffer_size: the number of pieces (see fragments) joined into one out.write call
+		Output:
+		* Writes str(self) to out without building the whole string in memory
+		"""
+		buffer = []
+		for fragment in self.fragments():
+			buffer.append(fragment)
+			if len(buffer) >= buffer_size:
+				out.write("".join(buffer))
+				buffer.clear()
+		buffer.append(";")
+		out.write("".join(buffer))
 
 	def __repr__(self):
 		return "Tree: " + str(self)
 
 	def __len__(self):
-		count = 1
-		for node in self.children:
-			count += len(node)
+		count = 0
+		stack = [self] # counted without recursion, so deep trees don't hit the recursion limit
+		while stack:
+			node = stack.pop()
+			count += 1
+			stack.extend(node.children)
 		return count
 
 	def isLeaf(self):
-		return len(self.children) == 0
+		return not self.children
+
+	def subtree_sizes(self):
+		"""
+		Returns a dictionary from every node of the tree to len(node), counted in one pass without recursion.
+		It is a snapshot: code that calls len() on many subtrees of a tree that isn't changing can look the
+		sizes up in it instead, but it isn't updated when the tree changes.
+		"""
+		sizes = {}
+		stack = [(self, False)]
+		while stack:
+			node, counted = stack.pop()
+			if counted:
+				size = 1
+				for child in node.children:
+					size += sizes[child]
+				sizes[node] = size
+			else:
+				stack.append((node, True))
+				for child in node.children:
+					if child.children:
+						stack.append((child, False))
+					else:
+						sizes[child] = 1
+		return sizes
 
 
 
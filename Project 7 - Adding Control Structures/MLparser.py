@@ -1,4 +1,4 @@
-from lexer import lexer
+from lexer import token_stream
 from tree import tree
 
 """
@@ -34,24 +34,23 @@ def getTokenLineInfo(token):
 
 def parser(source_file, token_file):
     """
-    :param source_file: A program written in the ML language.
+    :param source_file: A program written in the ML language - a file path, or an iterable of source text
+        pieces such as sys.stdin (see lexer.lexer_stream).
     :param token_file: A file defining the types of tokens in the ML language
     returns True if the code is syntactically correct.
     Throws a ParserError otherwise.
     """
 
-    G = lexer(source_file, token_file)
+    G = token_stream(source_file, token_file)
     try:
-        current, t, s = PROGRAM(next(G), G)
-        try:
-            next(G)  # at this point the source should have no more tokens - if the iterator has more, then it is actually a ParserError
-            raise ParserError("Syntax Error: Tokens exist after END keyword.")
-        except StopIteration:
-            return t, s
+        current, t, s = PROGRAM(G.advance(), G)
     except ParserError as e:
+        if G.at_eof:  # the program ran out of tokens before it was complete
+            raise ParserError("Syntax Error: Program ends before END token")
         raise e
-    except StopIteration:
-        raise ParserError("Syntax Error: Program ends before END token")
+    if G.advance().name != "EOF":  # at this point the source should have no more tokens
+        raise ParserError("Syntax Error: Tokens exist after END keyword.")
+    return t, s
 
 
 def PROGRAM(current, G):
@@ -60,7 +59,7 @@ def PROGRAM(current, G):
     if current.name == "BEGIN":
         t.children.append(tree("BEGIN"))
         # the returned child is the STATEMENT_LIST tree
-        current, child, s1 = STATEMENT_LIST(next(G), G)
+        current, child, s1 = STATEMENT_LIST(G.advance(), G)
         t.children.append(child)
         s.update(s1)
         if current.name == "END":
@@ -94,89 +93,89 @@ def STATEMENT(current, G):
     t = tree("STATEMENT")
     s = {}
     if current.name == "ID":
-        # make sure ASSIGNMENT is returning next(G)
+        # make sure ASSIGNMENT is returning G.advance()
         current, child, s1 = ASSIGNMENT(current, G)
         t.children.append(child)
         s.update(s1)
         if current.name != "SEMICOLON":
             raise ParserError("Syntax Error: Statement doesn't end with a semicolon" + getTokenLineInfo(current))
 
-        return next(G), t, s  # current should be a ;
+        return G.advance(), t, s  # current should be a ;
 
     elif current.name == "READ":
         t.children.append(tree("READ"))
-        current = next(G)
+        current = G.advance()
         if not current.name == "LPAREN":
             raise ParserError(
                 "Syntax Error: READ token is not followed by a (" + getTokenLineInfo(current))
-        current, child, s1 = ID_LIST(next(G), G)  # should be returning a )
+        current, child, s1 = ID_LIST(G.advance(), G)  # should be returning a )
         t.children.append(child)  # child should be the ID_LIST tree
         s.update(s1)
         if not current.name == "RPAREN":
             raise ParserError(
                 "Syntax Error: Missing closing ) in READ statement" + getTokenLineInfo(current))
-        current = next(G)
+        current = G.advance()
         if current.name != "SEMICOLON":
             raise ParserError("Syntax Error: Statement doesn't end with a semicolon" + getTokenLineInfo(current))
-        return next(G), t, s  # next(G) should be a <statement>
+        return G.advance(), t, s  # G.advance() should be a <statement>
 
     elif current.name == "WRITE":
         t.children.append(tree("WRITE"))
-        current = next(G)
+        current = G.advance()
         if not current.name == "LPAREN":
             raise ParserError(
                 "Syntax Error: WRITE token is not followed by a (" + getTokenLineInfo(current))
-        current, child, s1 = EXPR_LIST(next(G), G)  # should be returning a )
+        current, child, s1 = EXPR_LIST(G.advance(), G)  # should be returning a )
         t.children.append(child)
         s.update(s1)
         if not current.name == "RPAREN":
             raise ParserError(
                 "Syntax Error: Missing closing ) in WRITE statement" + getTokenLineInfo(current))
-        current = next(G)
+        current = G.advance()
         if current.name != "SEMICOLON":
             raise ParserError("Syntax Error: Statement doesn't end with a semicolon" + getTokenLineInfo(current))
 
-        return next(G), t, s  # next(G) should be a <statement>
+        return G.advance(), t, s  # G.advance() should be a <statement>
 
     elif current.t_class == "TYPE":
-        # DECLARATION returns a next(G)
+        # DECLARATION returns a G.advance()
         current, child, s1 = DECLARATION(current, G)
         t.children.append(child)
         s.update(s1)
         if current.name != "SEMICOLON":
             raise ParserError("Syntax Error: Statement doesn't end with a semicolon" + getTokenLineInfo(current))
 
-        return next(G), t, s  # current should be a ; at this point
+        return G.advance(), t, s  # current should be a ; at this point
 
     elif current.name == "IF":
         t.children.append(tree("IF"))
-        current, child, s1 = EXPRESSION(next(G), G)
+        current, child, s1 = EXPRESSION(G.advance(), G)
         t.children.append(child)
         s.update(s1)
         if not current.name == "THEN":
             raise ParserError("Syntax Error: If must be followed with then")
         t.children.append(tree("THEN"))
-        current, child, s1 = PROGRAM(next(G), G)
+        current, child, s1 = PROGRAM(G.advance(), G)
         t.children.append(child)
         s.update(s1)
-        current = next(G)
+        current = G.advance()
         if current.name == "ELSE":
             t.children.append(tree("ELSE"))
-            current, child, s1 = PROGRAM(next(G), G)
+            current, child, s1 = PROGRAM(G.advance(), G)
             t.children.append(child)
             s.update(s1)
-            return next(G), t, s
+            return G.advance(), t, s
         return current, t, s
 
     elif current.name == "WHILE":
         t.children.append(tree("WHILE"))
-        current, child, s1 = EXPRESSION(next(G), G)
+        current, child, s1 = EXPRESSION(G.advance(), G)
         t.children.append(child)
         s.update(s1)
         current, child, s1 = PROGRAM(current, G)
         t.children.append(child)
         s.update(s1)
-        return next(G), t, s
+        return G.advance(), t, s
 
 
     else:
@@ -197,7 +196,7 @@ def ASSIGNMENT(current, G):
             "Syntax Error: Assignment operator does not follow identifier in assignment statement" + getTokenLineInfo(current))
     # should return something that follows expression - we will check for it
     # in whereever this function returns
-    current, child, s1 = EXPRESSION(next(G), G)
+    current, child, s1 = EXPRESSION(G.advance(), G)
     t.children.append(child)  # child should be EXPRESSION tree
     s.update(s1)
     return current, t, s
@@ -210,7 +209,7 @@ def ID_LIST(current, G):
     t.children.append(child)
     s.update(s1)
     while current.name == "COMMA":
-        current = next(G)
+        current = G.advance()
         current, child, s1 = IDENT(current, G)
         t.children.append(child)
         s.update(s1)
@@ -224,7 +223,7 @@ def EXPR_LIST(current, G):
     t.children.append(child)
     s.update(s1)
     while current.name == "COMMA":
-        current = next(G)
+        current = G.advance()
         current, child, s1 = EXPRESSION(current, G)
         t.children.append(child)
         s.update(s1)
@@ -238,11 +237,11 @@ def DECLARATION(current, G):
     # so don't need to check again here
     t = tree("DECLARATION")
     s = {}
-    # TYPE returns next(G) because it processes the type token
+    # TYPE returns G.advance() because it processes the type token
     current, child, s1, vartype = TYPE(current, G)
     t.children.append(child)
     s.update(s1)
-    # IDENT returns next(G) because it processes the identifier
+    # IDENT returns G.advance() because it processes the identifier
     current, child, s1 = IDENT(current, G, vartype)
     t.children.append(child)
     s.update(s1)
@@ -254,26 +253,26 @@ def TYPE(current, G):
     s = {}
     if current.name == "INT":
         t.children.append(tree("INT"))
-        return next(G), t, s, "INT"
+        return G.advance(), t, s, "INT"
     elif current.name == "BOOL":
         t.children.append(tree("BOOL"))
-        return next(G), t, s, "BOOL"
+        return G.advance(), t, s, "BOOL"
     elif current.name == "STRING":
         t.children.append(tree("STRING"))
-        return next(G), t, s, "STRING"
+        return G.advance(), t, s, "STRING"
 
 
 def EXPRESSION(current, G):
     t = tree("EXPRESSION")
     s = {}
-    # term1 should return next(G) I think? in current setup, we are doing
+    # term1 should return G.advance() I think? in current setup, we are doing
     # error checking at lowest level
     current, child, s1 = TERM1(current, G)
     t.children.append(child)
     s.update(s1)
     while current.name == "OR":
         t.children.append(tree("OR"))
-        current = next(G)  # move to token after "or"
+        current = G.advance()  # move to token after "or"
         current, child, s1 = TERM1(current, G)
         t.children.append(child)
         s.update(s1)
@@ -288,7 +287,7 @@ def TERM1(current, G):
     s.update(s1)
     while current.name == "AND":
         t.children.append(tree("AND"))
-        current = next(G)  # move to token after "and"
+        current = G.advance()  # move to token after "and"
         current, child, s1 = FACT1(current, G)
         t.children.append(child)
         s.update(s1)
@@ -300,7 +299,7 @@ def FACT1(current, G):
     s = {}
     if current.name == "NOT":
         t.children.append(tree("NOT"))
-        current, child, s1 = FACT2(next(G), G)
+        current, child, s1 = FACT2(G.advance(), G)
         t.children.append(child)
         s.update(s1)
         return current, t, s
@@ -323,7 +322,7 @@ def RELATION(current, G):
         t.val = current.pattern
         t.children.append(tree("RELATIONOP", val=current.pattern))
         # assume exp2 returns a useful current
-        current, child, s1 = EXP2(next(G), G)
+        current, child, s1 = EXP2(G.advance(), G)
         t.children.append(child)
         s.update(s1)
         return current, t, s
@@ -344,7 +343,7 @@ def EXP2(current, G):
         else:  # only other option is "MINUS"
             t.children.append(tree("MINUS"))
         # current returned by TERM2 must be useful
-        current, child, s1 = TERM2(next(G), G)
+        current, child, s1 = TERM2(G.advance(), G)
         t.children.append(child)
         s.update(s1)
     return current, t, s
@@ -367,7 +366,7 @@ def TERM2(current, G):
             t.children.append(tree("DIVIDE"))
         else:  # current.name == "MODULO"
             t.children.append(tree("MODULO"))
-        current, child, s1 = SIGN(next(G), G)
+        current, child, s1 = SIGN(G.advance(), G)
         t.children.append(child)
         s.update(s1)
         # Assumes FACT2 returns useful current
@@ -383,7 +382,7 @@ def SIGN(current, G):
     if current.t_class == "ARITHOP":
         if current.name == "MINUS":
             t.children.append(tree("MINUS"))
-            return next(G), t, s
+            return G.advance(), t, s
         else:
             raise ParserError(
                 "Syntax Error: Invalid sign for number." + getTokenLineInfo(current))
@@ -396,14 +395,14 @@ def FACT2(current, G):
     t = tree("FACT2")
     s = {}
     if current.name == "LPAREN":
-        current, child, s1 = EXPRESSION(next(G), G)
+        current, child, s1 = EXPRESSION(G.advance(), G)
         t.children.append(child)
         s.update(s1)
         if not current.name == "RPAREN":
             raise ParserError(
                 "Syntax Error: Expression not followed by matching ')' (in primary function)" + getTokenLineInfo(current))
         # should return something in {"," , ; , ) , + , -}
-        return next(G), t, s
+        return G.advance(), t, s
 
     elif current.name == "ID":
         # IDENT processes the ID and returns next token
@@ -418,17 +417,17 @@ def FACT2(current, G):
         t.val = current.pattern
         t.children.append(tree("INTLIT", val=current.pattern))
         # should return something in {"," , ; , ) , + , -}
-        return next(G), t, s
+        return G.advance(), t, s
 
     elif current.name == "BOOLLIT":
         t.val = current.pattern
         t.children.append(tree("BOOLLIT", val=current.pattern))
-        return next(G), t, s
+        return G.advance(), t, s
 
     elif current.name == "STRINGLIT":
         t.val = current.pattern
         t.children.append(tree("STRINGLIT", val=current.pattern))
-        return next(G), t, s
+        return G.advance(), t, s
 
     else:
         raise ParserError(
@@ -440,14 +439,14 @@ def PRIMARY(current, G):
     t = tree("PRIMARY")
     s = {}
     if current.name == "LPAREN":
-        current, child, s1 = EXPRESSION(next(G), G)
+        current, child, s1 = EXPRESSION(G.advance(), G)
         t.children.append(child)
         s.update(s1)
         if not current.name == "RPAREN":
             raise ParserError(
                 "Syntax Error: Expression not followed by matching ')' (in primary function)" + getTokenLineInfo(current))
         # should return something in {"," , ; , ) , + , -}
-        return next(G), t, s
+        return G.advance(), t, s
 
     elif current.name == "ID":
         # IDENT processes the ID and returns next token
@@ -462,18 +461,18 @@ def PRIMARY(current, G):
         t.val = current.pattern
         t.children.append(tree("INTLIT", val=current.pattern))
         # should return something in {"," , ; , ) , + , -}
-        return next(G), t, s
+        return G.advance(), t, s
 
     elif current.name == "BOOLLIT":
         t.val = current.pattern
         t.children.append(tree("BOOLLIT", val=current.pattern))
-        return next(G), t, s
+        return G.advance(), t, s
 
     elif current.name == "STRINGLIT":
         t.val = current.pattern
         print(t)
         t.children.append(tree("STRINGLIT"), val=current.pattern)
-        return next(G), t, s
+        return G.advance(), t, s
 
     else:
         raise ParserError(
@@ -490,6 +489,6 @@ def IDENT(current, G, vartype="notype"):
                           getTokenLineInfo(current))
     t.val = current.pattern
     t.children.append(tree("ID", val=current.pattern))
-    return next(G), t, s
+    return G.advance(), t, s
 
 
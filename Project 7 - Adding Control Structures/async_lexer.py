@@ -0,0 +1,55 @@
+import asyncio
+import os
+from lexer import StreamLexer
+
+"""
+Lexer for asyncio services.
+
+async_lexer is an async generator of the same tokens lexer() yields. The source is read a chunk at a
+time - a file in the event loop's default executor, so the loop never waits on the disk, or any
+asyncio stream reader - and every complete line is lexed as soon as it arrives (see lexer.StreamLexer).
+The lexer gives the event loop a turn after every chunk and every yield_every tokens, so a long lex
+doesn't hold up the other tasks of the service.
+"""
+
+CHUNK_SIZE = 1 << 16
+YIELD_EVERY = 1000
+
+async def async_lexer(source, token_file, engine = "regex", errors = None, chunk_size = CHUNK_SIZE, yield_every = YIELD_EVERY):
+	"""
+	Input:
+	* source: file containing the content to be tokenized, or an asyncio.StreamReader (anything with
+	  an async read(n) returning str or utf-8 bytes, and an empty chunk at the end)
+	* token_file: token file (see assignment specifications for format), or a LexerSpec
+	* engine: "regex", "keywords", "vector" or "dfa" (see lexer.lexer)
+	* errors: list to collect bad tokens in instead of stopping at the first one (see lexer.lexer)
+	* chunk_size: the number of bytes read at a time
+	* yield_every: the number of tokens lexed between turns of the event loop
+	Output:
+	* An async generator of Token objects for the tokens of source, throwing a LexerError if it hits
+	  a bad token. Offsets, line numbers and columns are the same as lexer()'s: a file is read as bytes, but
+	  its newlines are translated like lexer()'s text mode read (see lexer.StreamLexer).
+	"""
+	loop = asyncio.get_running_loop()
+	stream = StreamLexer(token_file, engine, errors)
+	src = None
+	if isinstance(source, (str, os.PathLike)):
+		src = await loop.run_in_executor(None, open, source, "rb")
+		read = lambda: loop.run_in_executor(None, src.read, chunk_size)
+	else:
+		read = lambda: source.read(chunk_size)
+	try:
+		count = 0
+		while True:
+			chunk = await read()
+			for token in stream.feed(chunk) if chunk else stream.close():
+				yield token
+				count += 1
+				if count % yield_every == 0:
+					await asyncio.sleep(0)
+			if not chunk:
+				break
+			await asyncio.sleep(0)
+	finally:
+		if src is not None:
+			src.close()
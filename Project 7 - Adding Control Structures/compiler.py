@@ -5,7 +5,8 @@ import code_generator
 
 def compiler(source, tokens, output):
 	t, s = MLparser.parser(source, tokens)
-	print(t)
+	t.write(sys.stdout) # the AST, streamed a piece at a time
+	print()
 	outfile = open(output, "w")
 
 	stringLitList = {}
@@ -40,11 +41,12 @@ if __name__ == "__main__":
 	parser.add_argument('-t', type = str, dest = 'token_file',
 					   help = "Token file", default = 'tokens.txt')
 	parser.add_argument('source_file', type = str,
-						help = "Source-code file", default = 'source.txt')
+						help = "Source-code file (- to read the source from stdin)", default = 'source.txt')
 	parser.add_argument('output_file', type = str,
 						help = 'output file name', default = "out.asm")
 
 	args = parser.parse_args()
 
-	# Call the compiler function
-	compiler(args.source_file, args.token_file, args.output_file)
\ No newline at end of file
+	# Call the compiler function - a source read from stdin is lexed line by line as it arrives, then parsed
+	source = sys.stdin if args.source_file == "-" else args.source_file
+	compiler(source, args.token_file, args.output_file)
\ No newline at end of file
@@ -0,0 +1,436 @@
+import bisect
+import json
+import re
+from lexer import LexerError, cache_file, load_spec, text_tokens, write_cache
+
+r"""
+Table driven lexer for the Micro-language.
+
+The regexs of a token file are compiled into one minimized DFA that is run with longest-match
+semantics - the longest lexeme wins and ties go to the rule listed first in the token file.
+This makes lexing linear in the size of the source no matter how many rules the token file has,
+and rules no longer need trailing context like (begin)(\W|$): the lexeme is the rule's first
+group, anything after that group is ignored because longest match already keeps "beginx" an ID.
+
+Supported regex syntax: literals, escapes, ., [...] sets, \w \W \d \D \s \S, groups, (?:...),
+|, *, +, ?, {m}, {m,}, {m,n}.
+
+The tables are cached in __lexcache__ next to the token file, keyed by the token file's content,
+so they are only built once per token file.
+"""
+
+TABLE_VERSION = 1
+MAX_CHAR = 0x110000
+
+
+#######################################
+# Regex parsing
+# The parser turns a regex into a small syntax tree made of tuples:
+#   ("set", source)          one character matching the single character regex source
+#   ("cat", [nodes])         concatenation
+#   ("alt", [nodes])         alternation
+#   ("star", node)           zero or more
+#   ("group", number, node)  capturing group
+#   ("eol",)                 $ (only allowed in trailing context)
+class RegexParser:
+
+	def __init__(self, regex):
+		self.regex = regex
+		self.pos = 0
+		self.groups = 0
+
+	def error(self, msg):
+		return LexerError("Lexer Generator Error: " + msg + " in regex " + self.regex + " at position " + str(self.pos))
+
+	def peek(self):
+		return self.regex[self.pos] if self.pos < len(self.regex) else ""
+
+	def parse(self):
+		node = self.alternation()
+		if self.pos != len(self.regex):
+			raise self.error("unbalanced )")
+		return node
+
+	def alternation(self):
+		branches = [self.sequence()]
+		while self.peek() == "|":
+			self.pos += 1
+			branches.append(self.sequence())
+		return branches[0] if len(branches) == 1 else ("alt", branches)
+
+	def sequence(self):
+		items = []
+		while self.peek() not in ("", "|", ")"):
+			items.append(self.repeat())
+		return ("cat", items)
+
+	def repeat(self):
+		node = self.atom()
+		while self.peek() in ("*", "+", "?", "{"):
+			char = self.peek()
+			if char == "{":
+				match = re.compile(r"\{(\d+)(,(\d*))?\}").match(self.regex, self.pos)
+				if not match:
+					raise self.error("bad repetition")
+				self.pos = match.end()
+				low = int(match.group(1))
+				high = low if match.group(2) is None else (int(match.group(3)) if match.group(3) else None)
+				node = repetition(node, low, high)
+			else:
+				self.pos += 1
+				if char == "*":
+					node = ("star", node)
+				elif char == "+":
+					node = ("cat", [node, ("star", node)])
+				else:
+					node = ("alt", [node, ("cat", [])])
+			if self.peek() == "?": # lazy quantifiers match the same language
+				self.pos += 1
+		return node
+
+	def atom(self):
+		char = self.peek()
+		self.pos += 1
+		if char == "(":
+			if self.regex.startswith("?:", self.pos):
+				self.pos += 2
+				node = self.alternation()
+			elif self.peek() == "?":
+				raise self.error("unsupported group")
+			else:
+				self.groups += 1
+				number = self.groups
+				node = ("group", number, self.alternation())
+			if self.peek() != ")":
+				raise self.error("missing )")
+			self.pos += 1
+			return node
+		if char == "[":
+			return ("set", self.bracket())
+		if char == "\\":
+			return ("set", self.escape())
+		if char == ".":
+			return ("set", "[^\\n]")
+		if char == "$":
+			return ("eol",)
+		if char in ("^", "*", "+", "?", "{"):
+			raise self.error("unsupported " + char)
+		return ("set", re.escape(char))
+
+	def escape(self):
+		char = self.peek()
+		if not char:
+			raise self.error("trailing \\")
+		self.pos += 1
+		if char in "wWdDsS":
+			return "\\" + char
+		if char in "ntrfv0":
+			return "\\" + char
+		if char.isalnum():
+			raise self.error("unsupported escape \\" + char)
+		return re.escape(char)
+
+	def bracket(self):
+		start = self.pos - 1
+		if self.peek() == "^":
+			self.pos += 1
+		if self.peek() == "]":
+			self.pos += 1
+		while self.peek() != "]":
+			if not self.peek():
+				raise self.error("missing ]")
+			if self.peek() == "\\":
+				self.pos += 1
+			self.pos += 1
+		self.pos += 1
+		return self.regex[start:self.pos]
+
+def repetition(node, low, high):
+	items = [node] * low
+	if high is None:
+		items.append(("star", node))
+	else:
+		items.extend([("alt", [node, ("cat", [])])] * (high - low))
+	return ("cat", items)
+
+def lexeme_tree(regex):
+	"""
+	Input:
+	* regex: a rule from the token file
+	Output:
+	* The syntax tree of the rule's lexeme - its first group, or the whole regex if it has
+	  no groups. Anything after the first group is trailing context and is dropped.
+	"""
+	parser = RegexParser(regex)
+	node = parser.parse()
+	if parser.groups == 0:
+		return node
+	items = node[1] if node[0] == "cat" else [node]
+	if not items or items[0][0] != "group":
+		raise parser.error("the lexeme group must start the regex")
+	return items[0][2]
+
+
+#######################################
+# NFA construction (Thompson)
+class NFA:
+
+	def __init__(self):
+		self.epsilon = [] # epsilon[state] = list of states
+		self.moves = [] # moves[state] = list of (atom, state)
+		self.accept = {} # state -> rule index
+		self.atoms = [] # single character regex sources
+		self.atom_index = {}
+
+	def state(self):
+		self.epsilon.append([])
+		self.moves.append([])
+		return len(self.epsilon) - 1
+
+	def atom(self, source):
+		if source not in self.atom_index:
+			self.atom_index[source] = len(self.atoms)
+			self.atoms.append(source)
+		return self.atom_index[source]
+
+	def fragment(self, node):
+		"""Returns the (start, end) states of an NFA fragment matching node"""
+		kind = node[0]
+		if kind == "group":
+			return self.fragment(node[2])
+		start = self.state()
+		if kind == "set":
+			end = self.state()
+			self.moves[start].append((self.atom(node[1]), end))
+		elif kind == "cat":
+			end = start
+			for item in node[1]:
+				item_start, item_end = self.fragment(item)
+				self.epsilon[end].append(item_start)
+				end = item_end
+		elif kind == "alt":
+			end = self.state()
+			for branch in node[1]:
+				branch_start, branch_end = self.fragment(branch)
+				self.epsilon[start].append(branch_start)
+				self.epsilon[branch_end].append(end)
+		elif kind == "star":
+			end = self.state()
+			inner_start, inner_end = self.fragment(node[1])
+			self.epsilon[start].extend([inner_start, end])
+			self.epsilon[inner_end].extend([inner_start, end])
+		else:
+			raise LexerError("Lexer Generator Error: $ is only supported after the lexeme group")
+		return start, end
+
+	def closure(self, states):
+		stack = list(states)
+		seen = set(states)
+		while stack:
+			for target in self.epsilon[stack.pop()]:
+				if target not in seen:
+					seen.add(target)
+					stack.append(target)
+		return frozenset(seen)
+
+
+#######################################
+# Character classes
+def char_classes(atoms):
+	"""
+	Input:
+	* atoms: single character regex sources used by the NFA
+	Output:
+	* A list of signatures (the set of atoms a character matches), one per character class.
+	  Class 0 is always the empty signature.
+	* The class of every ASCII character (list of 128 class ids)
+	* Sorted starting code points of the non-ASCII ranges and the class id of each range
+	"""
+	compiled = [re.compile(atom) for atom in atoms]
+	bounds = {0, 128, MAX_CHAR}
+	everything = None
+	for atom in atoms:
+		if len(atom) == 1 or len(atom) == 2 and atom[0] == "\\" and not atom[1].isalnum(): # a literal character
+			char = ord(atom[-1])
+			bounds.update((char, char + 1))
+		else:
+			if everything is None:
+				everything = "".join(map(chr, range(MAX_CHAR)))
+			for run in re.finditer("(?:" + atom + ")+", everything):
+				bounds.update(run.span())
+	bounds = sorted(bounds)
+
+	signatures, class_ids = [frozenset()], {frozenset(): 0}
+	ascii_classes, starts, range_classes = [], [], []
+	for start, end in zip(bounds, bounds[1:]):
+		char = chr(start)
+		signature = frozenset(index for index, regex in enumerate(compiled) if regex.fullmatch(char))
+		if signature not in class_ids:
+			class_ids[signature] = len(signatures)
+			signatures.append(signature)
+		class_id = class_ids[signature]
+		if start < 128:
+			ascii_classes.extend([class_id] * (end - start))
+		elif not range_classes or range_classes[-1] != class_id:
+			starts.append(start)
+			range_classes.append(class_id)
+	return signatures, ascii_classes, starts, range_classes
+
+
+#######################################
+# DFA construction
+def build_tables(classes, names, regexs):
+	"""
+	Input:
+	* classes, names, regexs: the three columns of a token file
+	Output:
+	* A dictionary holding the minimized DFA tables for the token file (see DFATables)
+	"""
+	nfa = NFA()
+	start = nfa.state()
+	for index, regex in enumerate(regexs):
+		rule_start, rule_end = nfa.fragment(lexeme_tree(regex))
+		nfa.epsilon[start].append(rule_start)
+		nfa.accept[rule_end] = index
+
+	signatures, ascii_classes, starts, range_classes = char_classes(nfa.atoms)
+
+	# subset construction
+	initial = nfa.closure([start])
+	dstates, dindex, trans, accept = [initial], {initial: 0}, [], []
+	for current in dstates:
+		rules = [nfa.accept[state] for state in current if state in nfa.accept]
+		accept.append(min(rules) if rules else -1) # ties go to the first rule in the token file
+		row = []
+		for signature in signatures:
+			targets = [target for state in current for atom, target in nfa.moves[state] if atom in signature]
+			if not targets:
+				row.append(-1)
+				continue
+			target = nfa.closure(targets)
+			if target not in dindex:
+				dindex[target] = len(dstates)
+				dstates.append(target)
+			row.append(dindex[target])
+		trans.append(row)
+
+	trans, accept = minimize(trans, accept)
+	return {"version": TABLE_VERSION, "classes": classes, "names": names, "ascii": ascii_classes,
+			"starts": starts, "range_classes": range_classes, "trans": trans, "accept": accept}
+
+def minimize(trans, accept):
+	"""
+	Moore's partition refinement. States start out split by the rule they accept and are split
+	further until states in the same block always move to the same blocks.
+	Returns the minimized transition and accept tables with the start state still numbered 0.
+	"""
+	block = accept[:]
+	while True:
+		keys = [(block[state],) + tuple(block[target] if target >= 0 else -2 for target in row)
+				for state, row in enumerate(trans)]
+		numbering = {}
+		for key in keys:
+			numbering.setdefault(key, len(numbering))
+		refined = [numbering[key] for key in keys]
+		if len(numbering) == len(set(block)):
+			break
+		block = refined
+
+	block = refined # block[0] == 0 because the start state is seen first
+	size = len(numbering)
+	new_trans, new_accept = [None] * size, [None] * size
+	for state, row in enumerate(trans):
+		if new_trans[block[state]] is None:
+			new_trans[block[state]] = [block[target] if target >= 0 else -1 for target in row]
+			new_accept[block[state]] = accept[state]
+	return new_trans, new_accept
+
+
+#######################################
+# Table cache
+_loaded = {} # token file digest -> DFATables
+
+def load_tables(token_file):
+	"""
+	Input:
+	* token_file: token file (see assignment specifications for format), or a LexerSpec
+	Output:
+	* The DFATables for the token file - read from the cache if they have been built before,
+	  built and written to the cache otherwise.
+	"""
+	spec = load_spec(token_file)
+	if spec.digest in _loaded:
+		return _loaded[spec.digest]
+	path = cache_file(spec.token_file, spec.digest, ".dfa.json") if spec.token_file else None
+	tables = None
+	try:
+		with open(path, "r") as fp:
+			tables = json.load(fp)
+		if tables.get("version") != TABLE_VERSION:
+			tables = None
+	except (OSError, TypeError, ValueError):
+		tables = None
+	if tables is None:
+		tables = build_tables(spec.classes, spec.names, spec.regexs)
+		if path:
+			write_cache(path, lambda fp: fp.write(json.dumps(tables).encode()))
+	_loaded[spec.digest] = DFATables(tables)
+	return _loaded[spec.digest]
+
+
+#######################################
+# Scanning
+class DFATables:
+	"""
+	The tables of a lexer DFA:
+	* classes, names: token class and name of every rule
+	* ascii: character class of every ASCII character
+	* starts, range_classes: character classes of the non-ASCII code point ranges
+	* trans: trans[state][character class] = next state, or -1 if there is none
+	* accept: accept[state] = the rule a state accepts, or -1
+	"""
+
+	def __init__(self, tables):
+		self.classes = tables["classes"]
+		self.names = tables["names"]
+		self.ascii = tables["ascii"]
+		self.starts = tables["starts"]
+		self.range_classes = tables["range_classes"]
+		self.trans = tables["trans"]
+		self.accept = tables["accept"]
+
+	def char_class(self, char):
+		code = ord(char)
+		if code < 128:
+			return self.ascii[code]
+		return self.range_classes[bisect.bisect_right(self.starts, code) - 1]
+
+	def match(self, text, pos, endpos):
+		"""
+		Returns (rule index, pos, end) of the longest token in text[pos:endpos], or None.
+		"""
+		ascii, trans, accept = self.ascii, self.trans, self.accept
+		state, rule, end = 0, -1, pos
+		for index in range(pos, endpos):
+			code = ord(text[index])
+			state = trans[state][ascii[code] if code < 128 else self.char_class(text[index])]
+			if state < 0:
+				break
+			if accept[state] >= 0:
+				rule, end = accept[state], index + 1
+		return (rule, pos, end) if rule >= 0 else None
+
+def dfa_lexer(source_file, token_file):
+	"""
+	Input:
+	* source_file: file containing the content to be tokenized
+	* token_file: token file (see assignment specifications for format), or a LexerSpec
+	Output:
+	* A generator that will iteratively return token objects corresponding to the tokens
+	  of source_file, throwing a LexerError if it hits a bad token.
+	"""
+	spec = load_spec(token_file)
+	tables = load_tables(spec)
+	with open(source_file, "r") as src:
+		text = src.read()
+	yield from text_tokens(text, spec, tables.match)
@@ -1,12 +1,27 @@
+from array import array
+import bisect
+import codecs
+import hashlib
+import io
+import mmap
+import os
+import pickle
 import re
+import struct
 import sys
+import time
 
 class LexerError(Exception):
 	"""
 	Exception to be thrown when the lexer encounters a bad token.
+	offset is the offset of the bad token in the source text, and line_num and col its line
+	number and column, when the lexer knows them.
 	"""
-	def __init__(self, msg):
+	def __init__(self, msg, offset = None, line_num = None, col = None):
 		self.msg = msg
+		self.offset = offset
+		self.line_num = line_num
+		self.col = col
 
 	def __str__(self):
 		return str(self.msg)
@@ -18,21 +33,44 @@ class Token:
 	* t_class: The token class.
 	* name: The name of the token.
 	* pattern: The specific pattern of the token
+	* offset: Offset of the token in the source text (None if the token wasn't made by the lexer)
+	* length: Length of the token
 	* line: The line containing the token
 	* line_num: The line number (numbered from 1)
 	* col: The column number (numbered from 0)
+	Tokens made by the lexer only store the offset and the LineIndex of the source they came from;
+	line, line_num and col are worked out from the index when they are read.
 	"""
+	__slots__ = ("t_class", "name", "pattern", "offset", "_where")
 
-	def __init__(self, t_class, name, pattern, line, line_num, col):
+	def __init__(self, t_class, name, pattern, line = None, line_num = None, col = None, offset = None, index = None):
 		"""
-		Constructor
+		Constructor - pass either line, line_num and col, or the offset and LineIndex of the token
 		"""
 		self.t_class = t_class
 		self.name = name
 		self.pattern = pattern
-		self.line = line
-		self.line_num = int(line_num)
-		self.col = int(col)
+		self.offset = offset
+		self._where = index if index is not None else (line, int(line_num), int(col))
+
+	@property
+	def length(self):
+		return len(self.pattern)
+
+	@property
+	def line(self):
+		where = self._where
+		return where[0] if type(where) is tuple else where.line(where.line_num(self.offset))
+
+	@property
+	def line_num(self):
+		where = self._where
+		return where[1] if type(where) is tuple else where.line_num(self.offset)
+
+	@property
+	def col(self):
+		where = self._where
+		return where[2] if type(where) is tuple else where.position(self.offset)[1]
 
 	def __str__(self):
 		"""
@@ -52,46 +90,978 @@ class Token:
 		"""
 		Defines behaviour of the == operator on the Token class
 		"""
+		if self._where is other._where and self.offset is not None: # same source - no need to build the lines
+			return self.t_class == other.t_class and self.name == other.name and \
+				   self.pattern == other.pattern and self.offset == other.offset
 		return self.t_class == other.t_class and self.name == other.name and \
 			   self.pattern == other.pattern and self.line == other.line and \
 			   self.line_num == other.line_num and self.col == other.col
 
 
-def lexer(source_file, token_file):
+_WHITESPACE = re.compile(r"\s*")
+
+# An ML string literal is a quote, any mix of word characters, whitespace and backslashes, then a quote.
+# That is the language of the STRINGLIT token regex, but its nested (\w*\s*\\*)* backtracks exponentially
+# on an unterminated literal, so the lexer scans the body with one flat character class instead - but only
+# for a STRINGLIT rule with exactly that regex. Any other STRINGLIT regex is the token file's own rule.
+_STRING_BODY = re.compile(r"[\w\s\\]*")
+STRING_RULE = "STRINGLIT"
+STRING_REGEX = r'(\"(\w*\s*\\*)*\")'
+_NEVER = "(?!)"
+
+# a keyword rule matches fixed words, like (begin)(\W|$) or (True|False)
+_KEYWORD_RULE = re.compile(r"\((\w+(?:\|\w+)*)\)(?:\(\\W\|\$\))?")
+
+def scan_string(text, pos, endpos):
 	"""
 	Input:
-	* source_file: file containing the content to be tokenized
-	* token_file: token file (see assignment specifications for format)
+	* text: the source being lexed
+	* pos: index of the opening quote
+	* endpos: end of the line holding the literal
 	Output:
-	* A generator that will iteratively return token objects corresponding to the tokens
-	  of source_file, throwing a LexerError if it hits a bad token.
+	* The index just past the closing quote, or -1 if the literal is not terminated.
+	  Runs in time linear in the length of the literal.
 	"""
-	classes, names, regexs = [], [], []
+	end = _STRING_BODY.match(text, pos + 1, endpos).end()
+	return end + 1 if end < endpos and text[end] == '"' else -1
 
-	definitions = open(token_file, "r")
-	for definition in definitions:
-		def_arr = definition.split()
-		classes.append(def_arr[0])
-		names.append(def_arr[1])
-		regexs.append(def_arr[2])
-
-	src = open(source_file, "r")
-	for linenum, line in enumerate(src, 1): #1 is start index for the enumeration
-		startline = line.rstrip() #the full starting line, right whitespace stripped
-		line = startline.lstrip() #will be changed as tokens in a line are found
-		colnum = len(startline) - len(line)
-		while line:
-			for index, regex in enumerate(regexs):
-				match = re.match(regex, line)
-				if match:
-					if match.group(1) == "#":
-						line = "" #hacky way to move to the next line (ends the while loop, empty string is false)
+def build_master_regex(regexs):
+	"""
+	Input:
+	* regexs: the token regexs, in the order they appear in the token file
+	Output:
+	* A compiled alternation of every regex, each wrapped in a named group, that
+	  tries the rules in file order just like a loop of re.match calls would.
+	* A list mapping the group number of each rule's wrapper group to the rule index.
+	* A list holding, for each rule, the group number of its lexeme (the rule's
+	  first group, or the whole rule if it has no groups).
+	"""
+	parts, rule_of_group, lexeme_groups = [], [None], []
+	for index, regex in enumerate(regexs):
+		parts.append("(?P<R" + str(index) + ">" + regex + ")")
+		outer = len(rule_of_group)
+		inner = re.compile(regex).groups
+		lexeme_groups.append(outer + 1 if inner else outer)
+		rule_of_group.extend([index] * (inner + 1))
+	return re.compile("|".join(parts)), rule_of_group, lexeme_groups
+
+#######################################
+# Token file specs
+CACHE_DIR = "__lexcache__"
+SPEC_VERSION = 3
+ENGINES = ("regex", "keywords", "vector", "dfa")
+
+def cache_file(token_file, digest, suffix):
+	"""
+	Returns the path of a cache file for a token file: cache files live in __lexcache__ next to
+	the token file and are named by the hash (digest) of the token file's content.
+	"""
+	return os.path.join(os.path.dirname(os.path.abspath(token_file)), CACHE_DIR, digest + suffix)
+
+def write_cache(path, write):
+	"""
+	Calls write(fp) on a temporary file that is then renamed to path, so readers never see a
+	half written cache file. An unwritable cache directory is ignored - it only costs a rebuild.
+	If write throws, the temporary file is removed and the exception passed on.
+	"""
+	temp = path + "." + str(os.getpid())
+	try:
+		os.makedirs(os.path.dirname(path), exist_ok=True)
+		try:
+			with open(temp, "wb") as fp:
+				write(fp)
+			os.replace(temp, path)
+		finally:
+			if os.path.exists(temp):
+				os.remove(temp)
+	except OSError:
+		pass
+
+class LexerSpec:
+	"""
+	A compiled token file that can be reused to lex any number of source files.
+	The variable instances for a spec are:
+	* classes, names, regexs: the three columns of the token file
+	* token_file: the path the spec was loaded from (None if built from the columns)
+	* digest: hash of the token file content, used to name cache files
+	* master, rule_of_group, lexeme_groups: the master regex (see build_master_regex)
+	* string_rule: index of the STRINGLIT rule if it has the ML string regex, STRING_REGEX (None otherwise)
+	* fallback: master regex of the rules after STRINGLIT, tried when a string literal is bad
+	* keywords: keyword table used by keyword_match (see keyword_table), built on first use
+	"""
+
+	_loaded = {} # (path, mtime, size) -> spec, so an unchanged token file is only read once per process
+
+	def __init__(self, classes, names, regexs, token_file = None, digest = None):
+		self.classes = [sys.intern(t_class) for t_class in classes]
+		self.names = [sys.intern(name) for name in names]
+		self.regexs = list(regexs)
+		self.token_file = token_file
+		self.digest = digest if digest is not None else hashlib.sha1(repr((self.classes, self.names, self.regexs)).encode()).hexdigest()
+
+		# string literals are matched by scan_string: the master regex only checks for the opening quote,
+		# and if the literal turns out to be bad the fallback regex tries the rules after STRINGLIT
+		regexs = self.regexs
+		self.string_rule = None
+		for rule, (name, regex) in enumerate(zip(self.names, self.regexs)):
+			if name == STRING_RULE and regex == STRING_REGEX:
+				self.string_rule = rule
+				break
+		self.fallback = None
+		if self.string_rule is not None:
+			self.fallback = build_master_regex([_NEVER] * (self.string_rule + 1) + regexs[self.string_rule + 1:])
+			regexs = regexs[:self.string_rule] + ['(?=")'] + regexs[self.string_rule + 1:]
+		self.master, self.rule_of_group, self.lexeme_groups = build_master_regex(regexs)
+		self.keywords = None
+		self._word_spec = None
+
+	@classmethod
+	def load(cls, token_file):
+		"""
+		Input:
+		* token_file: token file (see assignment specifications for format)
+		Output:
+		* The LexerSpec for the token file. Specs are kept in memory for the life of the process
+		  and pickled to __lexcache__ (keyed by the token file content), so a token file is only
+		  parsed and compiled once. Python can't persist a compiled regex, so loading from disk
+		  still recompiles the master regex from its cached source.
+		"""
+		stat = os.stat(token_file)
+		key = (os.path.abspath(token_file), stat.st_mtime_ns, stat.st_size)
+		if key in cls._loaded:
+			return cls._loaded[key]
+
+		with open(token_file, "rb") as fp:
+			content = fp.read()
+		digest = hashlib.sha1(content).hexdigest()
+		path = cache_file(token_file, digest, ".spec.pickle")
+		spec = None
+		try:
+			with open(path, "rb") as fp:
+				version, spec = pickle.load(fp)
+			if version != SPEC_VERSION:
+				spec = None
+		except (OSError, pickle.PickleError, EOFError, ValueError, AttributeError):
+			spec = None
+		if spec is None:
+			classes, names, regexs = read_token_file(content.decode())
+			spec = cls(classes, names, regexs, token_file, digest)
+			write_cache(path, lambda fp: pickle.dump((SPEC_VERSION, spec), fp))
+		spec.token_file = token_file
+		cls._loaded[key] = spec
+		return spec
+
+	def match(self, text, pos, endpos):
+		"""
+		Input:
+		* text: the source being lexed
+		* pos: where the token starts
+		* endpos: end of the line (the regexs see text[:endpos], so $ matches there)
+		Output:
+		* (rule index, lexeme start, lexeme end) of the first rule that matches at pos, or None
+		"""
+		match = self.master.match(text, pos, endpos)
+		rule_of_group, lexeme_groups = self.rule_of_group, self.lexeme_groups
+		if match and rule_of_group[match.lastindex] == self.string_rule:
+			end = scan_string(text, pos, endpos)
+			if end >= 0:
+				return self.string_rule, pos, end
+			match, rule_of_group, lexeme_groups = self.fallback[0].match(text, pos, endpos), self.fallback[1], self.fallback[2]
+		if not match:
+			return None
+		index = rule_of_group[match.lastindex]
+		start, end = match.span(lexeme_groups[index])
+		return index, start, end
+
+	def keyword_table(self):
+		"""
+		Builds the keyword table: the words of every keyword rule (a rule for fixed words like
+		(begin)(\W|$) or (True|False)) that a later rule, the identifier rule, also matches in full.
+		Sets self.keywords to a dictionary from each word to (identifier rule, keyword rule) and returns it.
+		The first keyword rule listed for a word wins.
+		"""
+		self.keywords, keyword_rules = {}, set()
+		for index, regex in enumerate(self.regexs):
+			rule = _KEYWORD_RULE.fullmatch(regex)
+			if not rule:
+				continue
+			for word in rule.group(1).split("|"):
+				for later in range(index + 1, len(self.regexs)):
+					if later in keyword_rules or _KEYWORD_RULE.fullmatch(self.regexs[later]):
+						continue
+					identifier = re.compile(self.regexs[later])
+					match = identifier.match(word)
+					if match and match.span(1 if identifier.groups else 0) == (0, len(word)):
+						self.keywords.setdefault(word, (later, index))
+						keyword_rules.add(index)
 						break
-					token = Token(classes[index], names[index], match.group(1), startline, linenum, colnum)
-					yield token
-					startline = line[match.end(1):] #used to see how much whitspace is stripped off
-					line = startline.lstrip()
-					colnum += (match.end(1) - match.start(1)) + (len(startline) - len(line)) #length of match + whitespace before next token
-					break
-				if index+1 == len(regexs): #if no match after checking the last element of the regexs list
-					raise LexerError("Lexical Error: invalid token - line " + str(linenum) + " column " + str(colnum))
\ No newline at end of file
+		regexs = [_NEVER if index in keyword_rules else regex for index, regex in enumerate(self.regexs)]
+		self._word_spec = LexerSpec(self.classes, self.names, regexs)
+		return self.keywords
+
+	def keyword_match(self, text, pos, endpos):
+		"""
+		Like match, but keyword rules are not tried one by one: a word is matched once by the
+		identifier rule and then looked up in the keyword table. Unlike match, a keyword is only
+		found as a whole word - "android" is one identifier, not AND followed by "roid".
+		"""
+		if self.keywords is None:
+			self.keyword_table()
+		found = self._word_spec.match(text, pos, endpos)
+		if found:
+			keyword = self.keywords.get(text[found[1]:found[2]])
+			if keyword and keyword[0] == found[0]:
+				return keyword[1], found[1], found[2]
+		return found
+
+	def tokens(self, source_file, errors = None):
+		"""
+		Input:
+		* source_file: file containing the content to be tokenized
+		* errors: list to collect bad tokens in instead of stopping at the first one (see scan)
+		Output:
+		* A generator of the tokens of source_file (see lexer)
+		"""
+		with open(source_file, "r") as src:
+			text = src.read()
+		return text_tokens(text, self, errors = errors)
+
+def read_token_file(content):
+	"""
+	Input:
+	* content: the text of a token file
+	Output:
+	* The classes, names and regexs columns of the token file
+	"""
+	classes, names, regexs = [], [], []
+	for definition in content.splitlines():
+		def_arr = definition.split()
+		if def_arr:
+			classes.append(def_arr[0])
+			names.append(def_arr[1])
+			regexs.append(def_arr[2])
+	return classes, names, regexs
+
+class LineIndex:
+	"""
+	Line start offsets of a source text, so a line and column are only worked out for the
+	offsets that need them. The offsets are found the first time they are used.
+	The variable instances for a line index are:
+	* text: the source text
+	* first_line: line number of the first line of text (text may be a piece of a longer source)
+	* first_offset: offset of the start of text in that source - the offsets given to line_num and position
+	  are offsets in the source
+	* starts: offset of the first character of every line in text (line first_line + n starts at starts[n])
+	"""
+
+	def __init__(self, text, first_line = 1, first_offset = 0):
+		self.text = text
+		self.first_line = first_line
+		self.first_offset = first_offset
+		self._starts = None
+
+	@property
+	def starts(self):
+		if self._starts is None:
+			self._starts = [0]
+			self._starts.extend(newline.end() for newline in re.finditer("\n", self.text))
+		return self._starts
+
+	def line_num(self, offset):
+		"""Returns the line number (numbered from 1) of the character at offset"""
+		return bisect.bisect_right(self.starts, offset - self.first_offset) + self.first_line - 1
+
+	def position(self, offset):
+		"""Returns the (line number, column) of the character at offset"""
+		line_num = self.line_num(offset)
+		return line_num, offset - self.first_offset - self.starts[line_num - self.first_line]
+
+	def line(self, line_num):
+		"""Returns line line_num, without its newline or trailing whitespace"""
+		line = line_num - self.first_line
+		start = self.starts[line]
+		end = self.starts[line + 1] - 1 if line + 1 < len(self.starts) else len(self.text)
+		return self.text[start:end].rstrip()
+
+class ShiftedOffsets:
+	"""
+	Ascending offsets into a text that relex edits, as a sequence. An edit moves every offset after it by its
+	change in length; that move is recorded instead of applied, so an edit only updates the offsets between it
+	and the previous edit. The variable instances for shifted offsets are:
+	* values: the stored offsets (a list or array)
+	* shift_from, shift: every offset from index shift_from on is stored shift short of its real value
+	"""
+
+	def __init__(self, values):
+		self.values = values
+		self.shift_from = len(values)
+		self.shift = 0
+
+	def __len__(self):
+		return len(self.values)
+
+	def __getitem__(self, i):
+		if i < 0:
+			i += len(self.values)
+		return self.values[i] + self.shift if i >= self.shift_from else self.values[i]
+
+	def __iter__(self):
+		for i in range(len(self.values)):
+			yield self[i]
+
+	def replace(self, lo, hi, offsets, delta):
+		"""Replaces offsets lo to hi with the (real) offsets of an edit, and moves every offset after them by delta"""
+		values, shift_from = self.values, self.shift_from
+		if shift_from < hi: # bring the offsets before the edit up to date
+			for i in range(shift_from, lo):
+				values[i] += self.shift
+			shift_from = hi
+		elif shift_from - hi <= len(values) - shift_from: # move the offsets between the edit and the recorded shift
+			for i in range(hi, shift_from):
+				values[i] += delta
+		else: # cheaper to apply the recorded shift, and record the edit's from the edit on
+			for i in range(shift_from, len(values)):
+				values[i] += self.shift
+			shift_from, self.shift = hi, 0
+		values[lo:hi] = offsets
+		self.shift_from = shift_from + len(offsets) - (hi - lo)
+		self.shift += delta
+
+def scan(text, match, pos = 0, end = None, index = None, errors = None):
+	"""
+	Input:
+	* text: the source text
+	* match: match(text, pos, endpos) returning (rule index, lexeme start, lexeme end) or None,
+	  e.g. LexerSpec.match
+	* pos, end: the part of text to lex - pos must be the start of a line
+	* index: LineIndex of text, used to place a bad token (made on demand if not given)
+	* errors: recovery mode - a list that a LexerError is appended to for every run of bad characters,
+	  which are then skipped, instead of throwing at the first one
+	Output:
+	* A generator of (rule index, lexeme start, lexeme end) for every token, throwing a LexerError if it
+	  hits a bad token. Offsets are into text, which is never copied. Tokens never span lines: every line
+	  is lexed up to its last non-whitespace character, and a # token skips the rest of the line.
+	"""
+	if end is None:
+		end = len(text)
+	skip_whitespace = _WHITESPACE.match
+	bad_end = -1 # end of the last run of bad characters
+	while pos < end:
+		line_end = text.find("\n", pos, end)
+		next_line = line_end + 1
+		if line_end < 0:
+			line_end = next_line = end
+		while line_end > pos and text[line_end - 1].isspace():
+			line_end -= 1
+		pos = skip_whitespace(text, pos, line_end).end()
+		while pos < line_end:
+			found = match(text, pos, line_end)
+			if not found:
+				if pos != bad_end: # not just the next character of the last run
+					index = index or LineIndex(text)
+					line_num, col = index.position(pos)
+					error = LexerError("Lexical Error: invalid token - line " + str(line_num) + " column " + str(col), pos, line_num, col)
+					if errors is None:
+						raise error
+					errors.append(error)
+				bad_end = pos + 1
+				pos = skip_whitespace(text, bad_end, line_end).end()
+				continue
+			if found[2] - found[1] == 1 and text[found[1]] == "#":
+				break #comment - move on to the next line
+			yield found
+			pos = skip_whitespace(text, found[2], line_end).end()
+		pos = next_line
+
+def text_tokens(text, token_file, match = None, errors = None):
+	"""
+	Input:
+	* text: the content to be tokenized
+	* token_file: token file (see assignment specifications for format), or a LexerSpec
+	* match: the match function to lex with (see scan), LexerSpec.match by default
+	* errors: list to collect bad tokens in instead of stopping at the first one (see scan)
+	Output:
+	* A generator of Token objects for the tokens of text (see lexer), returning errors when it is done
+	"""
+	spec = load_spec(token_file)
+	index = LineIndex(text)
+	classes, names = spec.classes, spec.names
+	lexemes = {} # repeated lexemes (keywords, identifiers) share one string
+	for rule, start, end in scan(text, match or spec.match, index = index, errors = errors):
+		pattern = text[start:end]
+		yield Token(classes[rule], names[rule], lexemes.setdefault(pattern, pattern), offset = start, index = index)
+	return errors
+
+# Binary token files (TokenArrays.save): a header, then the end offset of every string (the token
+# classes, the token names, then the lexemes) as unsigned ints, the utf-8 strings, the utf-8 source
+# text and the kinds, offsets, lengths and lexeme_ids arrays. Every section starts 4 byte aligned so
+# the arrays can be used in place; the arrays are in the byte order of the machine that wrote them.
+# The sizes and offsets are 32 bit, so the strings and the text must each be under TOKEN_FILE_LIMIT bytes.
+TOKEN_MAGIC = b"MLTOKENS" if sys.byteorder == "little" else b"SNEKOTLM"
+TOKEN_VERSION = 2
+TOKEN_HEADER = struct.Struct("=8s6I20s") # magic, version, kind count, token count, lexeme count, strings size, text size, source digest
+TOKEN_FILE_LIMIT = 1 << 32
+
+class TokenArrays:
+	"""
+	The whole token stream of a source as parallel arrays, for code that wants to work on integer
+	codes instead of Token objects. Token i has:
+	* kinds[i]: its kind id - the index of its rule in the token file (array of unsigned shorts)
+	* offsets[i], lengths[i]: where its lexeme is in text (arrays of unsigned ints - offsets is a ShiftedOffsets
+	  once relex has edited the arrays)
+	* lexeme_ids[i]: index of its lexeme in the lexemes table (array of unsigned ints)
+	The other variable instances are:
+	* text: the source text, index: its LineIndex
+	* classes, names: token class and name of every kind id
+	* kind_ids: kind id of every token name, e.g. arrays.kinds[i] == arrays.kind_ids["SEMICOLON"]
+	* lexemes: every distinct lexeme, in order of first appearance
+	* source_digest: hash (20 bytes) of what the tokens were lexed from, saved with them so a cached token file
+	  can be checked for staleness (see tokenize_all) - empty if unknown
+	A TokenArrays can be saved to a binary token file and loaded back without lexing (see save and load).
+	"""
+
+	def __init__(self, text, classes, names, kinds = None, offsets = None, lengths = None, lexeme_ids = None, lexemes = None,
+				 source_digest = b""):
+		self.text = text
+		self.index = LineIndex(text)
+		self.classes = classes
+		self.names = names
+		self.kind_ids = {name: kind for kind, name in enumerate(names)}
+		self.kinds = kinds if kinds is not None else array("H")
+		self.offsets = offsets if offsets is not None else array("I")
+		self.lengths = lengths if lengths is not None else array("I")
+		self.lexeme_ids = lexeme_ids if lexeme_ids is not None else array("I")
+		self.lexemes = lexemes if lexemes is not None else []
+		self.source_digest = source_digest
+		self._lexeme_table = None
+
+	def __len__(self):
+		return len(self.kinds)
+
+	def __iter__(self):
+		for i in range(len(self.kinds)):
+			yield self.token(i)
+
+	def lexeme(self, i):
+		return self.lexemes[self.lexeme_ids[i]]
+
+	def lexeme_id(self, pattern):
+		"""Returns the id of pattern in the lexeme table, adding it to the table if it is new"""
+		if self._lexeme_table is None:
+			self._lexeme_table = {lexeme: lexeme_id for lexeme_id, lexeme in enumerate(self.lexemes)}
+		lexeme_id = self._lexeme_table.get(pattern)
+		if lexeme_id is None:
+			lexeme_id = self._lexeme_table[pattern] = len(self.lexemes)
+			self.lexemes.append(pattern)
+		return lexeme_id
+
+	def token(self, i):
+		"""Returns token i as a Token object"""
+		kind = self.kinds[i]
+		return Token(self.classes[kind], self.names[kind], self.lexeme(i), offset = self.offsets[i], index = self.index)
+
+	__getitem__ = token
+
+	def write(self, fp):
+		"""
+		Writes the arrays to a binary file object in the token file format (see TOKEN_HEADER), throwing a
+		LexerError if the source is too large for it
+		"""
+		strings = [string.encode("utf-8") for string in list(self.classes) + list(self.names) + self.lexemes]
+		text = self.text.encode("utf-8")
+		if sum(map(len, strings)) >= TOKEN_FILE_LIMIT or len(text) >= TOKEN_FILE_LIMIT:
+			raise LexerError("Token File Error: the source is too large for a token file (" + str(TOKEN_FILE_LIMIT) + " bytes or more)")
+		ends = array("I", [0])
+		for string in strings:
+			ends.append(ends[-1] + len(string))
+		fp.write(TOKEN_HEADER.pack(TOKEN_MAGIC, TOKEN_VERSION, len(self.names), len(self.kinds),
+								   len(self.lexemes), ends[-1], len(text), self.source_digest))
+		for section in (ends.tobytes(), b"".join(strings), text, array("H", self.kinds).tobytes()):
+			fp.write(section + bytes(-len(section) % 4)) # every section starts 4 byte aligned
+		for values in (self.offsets, self.lengths, self.lexeme_ids):
+			fp.write(array("I", values).tobytes())
+
+	def save(self, path):
+		"""Saves the arrays to a binary token file"""
+		with open(path, "wb") as fp:
+			self.write(fp)
+
+	@classmethod
+	def load(cls, path, copy = False):
+		"""
+		Input:
+		* path: a binary token file written by save
+		* copy: False to get the kinds, offsets, lengths and lexeme_ids of the file itself, as read only
+		  memoryviews of the memory mapped file, or True to copy them into arrays that can be changed (see relex)
+		Output:
+		* The TokenArrays saved in the file, throwing a LexerError if the file isn't a token file
+		"""
+		with open(path, "rb") as fp:
+			data = memoryview(mmap.mmap(fp.fileno(), 0, access = mmap.ACCESS_READ))
+		if len(data) < TOKEN_HEADER.size or bytes(data[:len(TOKEN_MAGIC)]) != TOKEN_MAGIC:
+			raise LexerError("Token File Error: " + str(path) + " is not a token file")
+		version = struct.unpack_from("=I", data, len(TOKEN_MAGIC))[0]
+		if version != TOKEN_VERSION:
+			raise LexerError("Token File Error: " + str(path) + " has version " + str(version))
+		magic, version, kind_count, count, lexeme_count, strings_size, text_size, source_digest = TOKEN_HEADER.unpack_from(data)
+		pos = TOKEN_HEADER.size
+		def section(size, typecode = "B"):
+			nonlocal pos
+			view = data[pos:pos + size * array(typecode).itemsize]
+			if len(view) != size * array(typecode).itemsize:
+				raise LexerError("Token File Error: " + str(path) + " is truncated")
+			pos += len(view) + -len(view) % 4
+			return view.cast(typecode) if typecode != "B" else view
+		ends = section(2 * kind_count + lexeme_count + 1, "I")
+		blob = section(strings_size)
+		strings = [str(blob[ends[i]:ends[i + 1]], "utf-8") for i in range(len(ends) - 1)]
+		text = str(section(text_size), "utf-8")
+		views = [section(count, typecode) for typecode in "HIII"]
+		if copy:
+			views = [array(view.format, view) for view in views]
+		return cls(text, strings[:kind_count], strings[kind_count:2 * kind_count], *views,
+				   lexemes = strings[2 * kind_count:], source_digest = source_digest)
+
+	@staticmethod
+	def saved_digest(path):
+		"""Returns the source digest in the header of a token file, or None if it isn't a token file of this version"""
+		with open(path, "rb") as fp:
+			header = fp.read(TOKEN_HEADER.size)
+		if len(header) < TOKEN_HEADER.size or header[:len(TOKEN_MAGIC)] != TOKEN_MAGIC:
+			return None
+		magic, version, *sizes, source_digest = TOKEN_HEADER.unpack(header)
+		return source_digest if version == TOKEN_VERSION else None
+
+class TokenStream:
+	"""
+	The tokens of a source for a parser to read, with lookahead and an EOF token instead of StopIteration.
+	The variable instances for a token stream are:
+	* tokens: the tokens - a list of Token objects, or a TokenArrays
+	* pos: index of the next token advance() returns
+	* error: the LexerError of the first bad token after the tokens, or None - it is thrown when the
+	  parser reads past the last token, just where lexer() would throw it
+	* eof: the EOF token (class and name "EOF", empty lexeme) returned after the last token
+	"""
+
+	def __init__(self, tokens, eof, error = None):
+		self.tokens = tokens
+		self.end = len(tokens)
+		self.pos = 0
+		self.eof = eof
+		self.error = error
+
+	def token(self, i):
+		"""Returns token i of the stream, the EOF token past the last one"""
+		if i < self.end:
+			return self.tokens[i]
+		if self.error is not None:
+			raise self.error
+		return self.eof
+
+	def peek(self, k = 0):
+		"""Returns the token k tokens after the next one (peek() is the token advance() returns next) without reading it"""
+		return self.token(self.pos + k)
+
+	def advance(self):
+		"""Reads and returns the next token - the EOF token once every token has been read"""
+		token = self.token(self.pos)
+		self.pos += 1
+		return token
+
+	@property
+	def at_eof(self):
+		"""True once advance() has returned the EOF token"""
+		return self.pos > self.end
+
+def token_stream(source_file, token_file, engine = "regex"):
+	"""
+	Input:
+	* source_file: file containing the content to be tokenized, or an iterable of str or utf-8 bytes source pieces
+	* token_file: token file (see assignment specifications for format), or a LexerSpec
+	* engine: "regex", "keywords", "vector" or "dfa" (see lexer)
+	Output:
+	* A TokenStream of the tokens of source_file. A file is lexed in one batch, source pieces as they
+	  arrive (see StreamLexer). A bad token is thrown as a LexerError when the stream gets to it, so the
+	  tokens before it can still be read.
+	"""
+	spec = load_spec(token_file)
+	tokens, error = [], None
+	if not isinstance(source_file, (str, os.PathLike)):
+		stream = StreamLexer(spec, engine)
+		try:
+			for chunk in source_file:
+				tokens.extend(stream.feed(chunk))
+			tokens.extend(stream.close())
+		except LexerError as e: # the tokens before the bad token are already in tokens
+			error = e
+		return TokenStream(tokens, stream.eof(), error)
+	with open(source_file, "r") as src:
+		text = src.read()
+	try:
+		tokens.extend(text_tokens(text, spec, engine_match(spec, engine)))
+	except LexerError as e:
+		error = e
+	return TokenStream(tokens, Token("EOF", "EOF", "", offset = len(text), index = LineIndex(text)), error)
+
+def tokenize_text(text, token_file, match = None, errors = None):
+	"""
+	Input:
+	* text: the content to be tokenized
+	* token_file: token file (see assignment specifications for format), or a LexerSpec
+	* match: the match function to lex with (see scan), LexerSpec.match by default
+	* errors: list to collect bad tokens in instead of stopping at the first one (see scan)
+	Output:
+	* The TokenArrays of text, throwing a LexerError if it hits a bad token
+	"""
+	spec = load_spec(token_file)
+	arrays = TokenArrays(text, spec.classes, spec.names)
+	kinds, offsets, lengths, lexeme_ids = arrays.kinds, arrays.offsets, arrays.lengths, arrays.lexeme_ids
+	lexemes, lexeme_table = arrays.lexemes, {}
+	for rule, start, end in scan(text, match or spec.match, index = arrays.index, errors = errors):
+		pattern = text[start:end]
+		lexeme_id = lexeme_table.get(pattern)
+		if lexeme_id is None:
+			lexeme_id = lexeme_table[pattern] = len(lexemes)
+			lexemes.append(pattern)
+		kinds.append(rule)
+		offsets.append(start)
+		lengths.append(end - start)
+		lexeme_ids.append(lexeme_id)
+	arrays._lexeme_table = lexeme_table
+	return arrays
+
+def relex(arrays, offset, deleted, inserted, token_file, match = None):
+	"""
+	Input:
+	* arrays: the TokenArrays of a source, from tokenize_all/tokenize_text or an earlier relex
+	* offset, deleted, inserted: the edit - deleted characters starting at offset were replaced by
+	  the string inserted
+	* token_file: token file (see assignment specifications for format), or a LexerSpec
+	* match: the match function to lex with (see scan), LexerSpec.match by default
+	Output:
+	* arrays, updated in place to hold the tokens of the edited text. Throws a LexerError, leaving
+	  arrays unchanged, if the edited lines have a bad token.
+	Tokens never span lines and every line is lexed on its own, so only the lines touched by the edit
+	are lexed again: from the start of the line holding offset to the end of the line holding the end
+	of the edit, where the token stream is back in sync with the old one. Tokens after that are only
+	moved by the change in length, and even that is recorded rather than done (see ShiftedOffsets), so
+	the Python work of an edit is the lines it touched plus the tokens and lines since the previous edit.
+	Copying the text and the arrays around the edit is still done, by C memmoves.
+	After the first edit arrays.offsets and arrays.index.starts are ShiftedOffsets, and Tokens taken
+	from arrays before an edit no longer have the right line and column.
+	"""
+	spec = load_spec(token_file)
+	old_text = arrays.text
+	edit_end = offset + deleted
+	delta = len(inserted) - deleted
+	text = old_text[:offset] + inserted + old_text[edit_end:]
+
+	# lex the lines the edit touched (the index of the edited text is only built if there is a bad token)
+	starts = arrays.index.starts
+	first, last = bisect.bisect_right(starts, offset), bisect.bisect_right(starts, edit_end)
+	restart = starts[first - 1]
+	old_resync = old_text.find("\n", edit_end)
+	old_resync = len(old_text) if old_resync < 0 else old_resync
+	found = list(scan(text, match or spec.match, restart, old_resync + delta, LineIndex(text)))
+
+	# splice in the new tokens and line starts, recording the shift of the ones after the edit
+	if not isinstance(starts, ShiftedOffsets):
+		starts = ShiftedOffsets(starts)
+	starts.replace(first, last, [offset + newline.end() for newline in re.finditer("\n", inserted)], delta)
+	offsets = arrays.offsets
+	if not isinstance(offsets, ShiftedOffsets):
+		offsets = arrays.offsets = ShiftedOffsets(offsets)
+	lo, hi = bisect.bisect_left(offsets, restart), bisect.bisect_left(offsets, old_resync)
+	arrays.kinds[lo:hi] = array("H", [rule for rule, start, end in found])
+	arrays.lengths[lo:hi] = array("I", [end - start for rule, start, end in found])
+	arrays.lexeme_ids[lo:hi] = array("I", [arrays.lexeme_id(text[start:end]) for rule, start, end in found])
+	offsets.replace(lo, hi, array(offsets.values.typecode, [start for rule, start, end in found]), delta)
+	index = LineIndex(text)
+	index._starts = starts
+	arrays.text, arrays.index = text, index
+	return arrays
+
+def tokenize_all(source_file, token_file, engine = "regex", processes = None, errors = None, cache = False):
+	"""
+	Input:
+	* source_file: file containing the content to be tokenized
+	* token_file: token file (see assignment specifications for format), or a LexerSpec
+	* engine: "regex", "keywords", "vector" or "dfa" (see lexer)
+	* processes: lex the file in this many processes at once (see parallel_lexer.py) - not with errors (ValueError)
+	* errors: list to collect bad tokens in instead of stopping at the first one (see lexer)
+	* cache: save the tokens to a binary token file in __lexcache__ next to the source, one per source path and
+	  engine, and load them from there the next time instead of lexing, as long as the digest of the source and
+	  token file contents and the engine in its header still matches
+	Output:
+	* The TokenArrays of the whole file, throwing a LexerError if it hits a bad token. Cached or not,
+	  its arrays can be changed (see relex). Throws a ValueError for an unknown engine.
+	"""
+	check_engine(engine)
+	spec = load_spec(token_file)
+	with open(source_file, "r") as src:
+		text = src.read()
+	if errors is not None:
+		if processes and processes > 1:
+			raise ValueError("processes can't be used with errors")
+		return tokenize_text(text, spec, engine_match(spec, engine), errors)
+	if cache:
+		name = hashlib.sha1("\0".join((os.path.abspath(source_file), engine)).encode("utf-8")).hexdigest()
+		path = cache_file(source_file, name, ".tokens")
+		digest = hashlib.sha1("\0".join((spec.digest, engine, text)).encode("utf-8")).digest()
+		try:
+			if TokenArrays.saved_digest(path) == digest:
+				return TokenArrays.load(path, copy = True)
+		except (OSError, LexerError, ValueError):
+			pass # a missing or bad cache file is rebuilt
+		arrays = tokenize_all(source_file, spec, engine, processes)
+		arrays.source_digest = digest
+		try:
+			write_cache(path, arrays.write) # replaces the token file of the last version of the source
+		except LexerError:
+			pass # too large to cache
+		return arrays
+	if processes and processes > 1:
+		from parallel_lexer import parallel_tokenize
+		arrays, error = parallel_tokenize(text, spec, engine, processes)
+		if error:
+			raise error
+		return arrays
+	return tokenize_text(text, spec, engine_match(spec, engine))
+
+def load_spec(token_file):
+	"""Returns token_file if it is already a LexerSpec, otherwise the LexerSpec loaded from the path"""
+	return token_file if isinstance(token_file, LexerSpec) else LexerSpec.load(token_file)
+
+def engine_match(spec, engine):
+	"""
+	Returns the match function (see scan) of a lexer engine, "regex", "keywords", "vector" or "dfa", for a LexerSpec.
+	Call it once per lex: the vector engine's match function keeps the pre-pass of the text it is lexing.
+	Throws a ValueError for any other engine.
+	"""
+	check_engine(engine)
+	if engine == "dfa":
+		from dfa_lexer import load_tables # imported here because dfa_lexer imports this module
+		return load_tables(spec).match
+	if engine == "keywords":
+		return spec.keyword_match
+	if engine == "vector":
+		from vector_lexer import vector_match
+		return vector_match(spec)
+	return spec.match
+
+def check_engine(engine):
+	"""Throws a ValueError if engine isn't one of ENGINES"""
+	if engine not in ENGINES:
+		raise ValueError("unknown lexer engine " + repr(engine) + " (choose from " + ", ".join(ENGINES) + ")")
+
+
+#######################################
+# Lexing
+class StreamLexer:
+	"""
+	Lexes a source that arrives in pieces (stdin, a pipe, a socket). Tokens never span lines, so only
+	the unfinished last line is held back between pieces; everything before it is lexed as soon as it
+	arrives. Tokens get the offset, line number and column they have in the whole stream. Newlines are
+	translated like a file opened in text mode ("\r\n" and "\r" become "\n"), so the offsets are lexer()'s.
+	The variable instances for a stream lexer are:
+	* spec: the LexerSpec, match: the match function of the engine, or the one passed in (see scan)
+	* decoder, newlines: incremental decoders, translating newlines, of bytes and str pieces - a "\r" at the
+	  end of a piece waits for the next piece, in case it is the start of a "\r\n"
+	* pending: the pieces of the unfinished last line - joined only once the line is complete, so a long line
+	  that arrives in many pieces isn't copied for every piece
+	* offset, line_num: stream offset and line number of pending
+	* index: LineIndex of the lines lexed last
+	* errors: list collecting bad tokens instead of stopping at the first one (see scan), or None
+	"""
+
+	def __init__(self, token_file, engine = "regex", errors = None, match = None):
+		"""
+		Input:
+		* token_file: token file (see assignment specifications for format), or a LexerSpec
+		* engine: "regex", "keywords", "vector" or "dfa" (see lexer)
+		* errors: list to collect bad tokens in instead of stopping at the first one (see lexer)
+		* match: match function to lex with instead of the engine's, e.g. LexerStats.match
+		"""
+		self.spec = load_spec(token_file)
+		self.match = match if match is not None else engine_match(self.spec, engine)
+		self.decoder = io.IncrementalNewlineDecoder(codecs.getincrementaldecoder("utf-8")(), translate = True)
+		self.newlines = io.IncrementalNewlineDecoder(None, translate = True)
+		self.pending = []
+		self.offset = 0
+		self.line_num = 1
+		self.index = LineIndex("") # of the text lexed last
+		self.errors = errors
+		self.lexemes = {} # repeated lexemes (keywords, identifiers) share one string
+
+	def feed(self, chunk):
+		"""
+		Input:
+		* chunk: the next piece of the source - str, or utf-8 bytes (a character may be split between pieces)
+		Output:
+		* A generator of the Token objects of the lines chunk completes, throwing a LexerError if it hits a bad token
+		"""
+		chunk = self.newlines.decode(chunk) if isinstance(chunk, str) else self.decoder.decode(chunk)
+		end = chunk.rfind("\n") + 1 # only the new piece is searched
+		if not end:
+			if chunk:
+				self.pending.append(chunk)
+			return iter(())
+		self.pending.append(chunk[:end])
+		text = "".join(self.pending)
+		self.pending = [chunk[end:]] if end < len(chunk) else []
+		return self._tokens(text)
+
+	def close(self):
+		"""Returns a generator of the Token objects of the last line, for when the source has no more pieces"""
+		self.pending.append(self.decoder.decode(b"", final = True) + self.newlines.decode("", final = True))
+		text = "".join(self.pending)
+		self.pending = []
+		return self._tokens(text)
+
+	def eof(self):
+		"""Returns the EOF token (see TokenStream) of the stream, at its end - for after close"""
+		return Token("EOF", "EOF", "", offset = self.offset, index = self.index)
+
+	def _tokens(self, text):
+		"""Moves the stream position past text (whole lines) and returns a generator of its tokens"""
+		offset, line_num = self.offset, self.line_num
+		self.index = LineIndex(text, line_num, offset) # tokens work out their line and column from it when asked
+		self.offset += len(text)
+		self.line_num += text.count("\n")
+		return self._lex(text, offset, line_num, self.index)
+
+	def _lex(self, text, offset, line_num, index):
+		classes, names, lexemes, errors = self.spec.classes, self.spec.names, self.lexemes, self.errors
+		first_error = len(errors) if errors is not None else 0
+		try:
+			for rule, start, end in scan(text, self.match, index = LineIndex(text, line_num), errors = errors):
+				pattern = text[start:end]
+				yield Token(classes[rule], names[rule], lexemes.setdefault(pattern, pattern), offset = offset + start, index = index)
+		except LexerError as error:
+			raise LexerError(error.msg, offset + error.offset, error.line_num, error.col)
+		finally:
+			for error in errors[first_error:] if errors is not None else ():
+				error.offset += offset # errors were placed in text - move them to the stream
+
+def lexer_stream(chunks, token_file, engine = "regex", errors = None, match = None):
+	"""
+	Input:
+	* chunks: an iterable of str or utf-8 bytes pieces of the source, e.g. sys.stdin, a pipe or
+	  iter(functools.partial(sock.recv, 4096), b"")
+	* token_file: token file (see assignment specifications for format), or a LexerSpec
+	* engine: "regex", "keywords", "vector" or "dfa" (see lexer)
+	* errors: list to collect bad tokens in instead of stopping at the first one (see lexer)
+	* match: match function to lex with instead of the engine's (see StreamLexer)
+	Output:
+	* A generator of Token objects that yields the tokens of each line as soon as the line is complete,
+	  throwing a LexerError if it hits a bad token. Offsets are into the whole stream.
+	"""
+	stream = StreamLexer(token_file, engine, errors, match)
+	for chunk in chunks:
+		yield from stream.feed(chunk)
+	yield from stream.close()
+	return errors
+
+class LexerStats:
+	"""
+	Per rule instrumentation of a lex: pass a LexerStats to lexer() to fill it in.
+	The rules are tried one by one in token file order, just like the master regex tries them, so
+	every rule gets the match attempts it would get there. The variable instances are:
+	* spec: the LexerSpec
+	* attempts[i], matches[i]: how many times rule i was tried, and how many times it matched
+	* seconds[i]: time spent in the regex of rule i (the linear string scan for STRINGLIT)
+	"""
+
+	def __init__(self, token_file):
+		self.spec = load_spec(token_file)
+		self.regexs = [re.compile(regex) for regex in self.spec.regexs]
+		self.attempts = [0] * len(self.regexs)
+		self.matches = [0] * len(self.regexs)
+		self.seconds = [0.0] * len(self.regexs)
+
+	def match(self, text, pos, endpos):
+		"""Same as LexerSpec.match, recording the attempts, matches and time of every rule it tries"""
+		attempts, matches, seconds, string_rule = self.attempts, self.matches, self.seconds, self.spec.string_rule
+		for index, regex in enumerate(self.regexs):
+			attempts[index] += 1
+			start = time.perf_counter()
+			if index == string_rule:
+				end = scan_string(text, pos, endpos) if text.startswith('"', pos, endpos) else -1
+				found = (index, pos, end) if end >= 0 else None
+			else:
+				match = regex.match(text, pos, endpos)
+				found = (index,) + match.span(1 if regex.groups else 0) if match else None
+			seconds[index] += time.perf_counter() - start
+			if found:
+				matches[index] += 1
+				return found
+		return None
+
+	def as_dict(self):
+		"""Returns {token name: {"attempts": ..., "matches": ..., "seconds": ...}} in token file order"""
+		return {name: {"attempts": self.attempts[index], "matches": self.matches[index], "seconds": self.seconds[index]}
+				for index, name in enumerate(self.spec.names)}
+
+	def __str__(self):
+		"""The counts as a table, the rules that took the most time first"""
+		rows = ["%-14s %10s %10s %10s %12s" % ("rule", "attempts", "matches", "seconds", "us/attempt")]
+		for index in sorted(range(len(self.regexs)), key = lambda index: -self.seconds[index]):
+			attempts = self.attempts[index]
+			rows.append("%-14s %10d %10d %10.4f %12.3f" % (self.spec.names[index], attempts, self.matches[index],
+				self.seconds[index], 1e6 * self.seconds[index] / attempts if attempts else 0.0))
+		return "\n".join(rows)
+
+def lexer(source_file, token_file, engine = "regex", processes = None, errors = None, stats = None):
+	"""
+	Input:
+	* source_file: file containing the content to be tokenized, or an iterable of source
+	  pieces (an open file, sys.stdin, ...) that is lexed as it is read (see lexer_stream)
+	* token_file: token file (see assignment specifications for format), or a LexerSpec
+	  loaded from one - pass the same spec to lex many files against one token file
+	* engine: "regex" tries the rules in token file order with a master regex,
+	  "keywords" does the same but finds keywords by looking identifiers up in a table (see LexerSpec.keyword_match),
+	  "vector" does the same but caches the tokens of repeated words (see vector_lexer.py),
+	  "dfa" runs the table driven longest-match lexer in dfa_lexer.py
+	* processes: lex the file in this many processes at once (see parallel_lexer.py) - only for a file
+	  path, without errors or stats
+	* errors: recovery mode - pass a list to keep lexing past bad tokens. Every run of bad characters is
+	  skipped and recorded in the list as a LexerError with its offset, line_num and col, and the list is
+	  also the generator's return value. Recovery mode lexes in one process.
+	* stats: a LexerStats for the same token file to record the match attempts, matches and time of every
+	  rule in. The rules are then tried one at a time in one process, whatever the engine, so the lex is slower.
+	Output:
+	* A generator that will iteratively return token objects corresponding to the tokens
+	  of source_file, throwing a LexerError if it hits a bad token. Throws a ValueError for an unknown
+	  engine, stats of another token file, or processes with a source that can't be lexed in processes.
+	"""
+	check_engine(engine)
+	spec = load_spec(token_file)
+	if stats is not None and stats.spec.digest != spec.digest:
+		raise ValueError("stats is for a different token file")
+	path = isinstance(source_file, (str, os.PathLike))
+	if processes and processes > 1 and (not path or errors is not None or stats is not None):
+		raise ValueError("processes can only lex a file path, without errors or stats")
+	if not path:
+		return (yield from lexer_stream(source_file, spec, engine, errors, stats.match if stats is not None else None))
+	if errors is not None or stats is not None:
+		with open(source_file, "r") as src:
+			text = src.read()
+		match = stats.match if stats is not None else engine_match(spec, engine)
+		return (yield from text_tokens(text, spec, match, errors))
+	if processes and processes > 1:
+		from parallel_lexer import parallel_tokenize
+		with open(source_file, "r") as src:
+			text = src.read()
+		arrays, error = parallel_tokenize(text, spec, engine, processes)
+		yield from arrays
+		if error:
+			raise error
+	elif engine == "dfa":
+		from dfa_lexer import dfa_lexer
+		yield from dfa_lexer(source_file, spec)
+	elif engine in ("keywords", "vector"):
+		with open(source_file, "r") as src:
+			text = src.read()
+		yield from text_tokens(text, spec, engine_match(spec, engine))
+	else:
+		yield from spec.tokens(source_file)
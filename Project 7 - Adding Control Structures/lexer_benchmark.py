@@ -0,0 +1,79 @@
+import argparse
+import math
+import os
+import sys
+import tempfile
+import time
+from lexer import ENGINES, lexer, LexerError
+
+"""
+Pathological input benchmark for the lexer.
+
+Each source file is a run of valid lines holding string literals followed by one line with a long
+unterminated literal ("aaaa...a!), the input that made the old STRINGLIT regex backtrack exponentially.
+The source size doubles every round; a linear lexer roughly doubles its time with it. The growth is
+judged by the exponent k of time ~ size**k fitted over all the sizes, not by one pair of timings, so
+timer noise on a single size can't fail the run.
+
+python lexer_benchmark.py -t tokens.txt
+"""
+
+def create_source(size, path):
+	"""Writes a source file of about size characters and returns the path"""
+	body = "a b\\n" * max(1, size // 16)
+	lines = ['write("' + body + '");'] * 4
+	lines.append('write("' + body * 4 + '!);')
+	with open(path, "w") as fp:
+		fp.write("\n".join(lines) + "\n")
+	return path
+
+def time_lexer(source_file, token_file, engine, repeat = 3):
+	"""Returns the best of repeat timings, in seconds, of lexing source_file up to its bad token"""
+	best = None
+	for i in range(repeat):
+		start = time.perf_counter()
+		try:
+			for token in lexer(source_file, token_file, engine = engine):
+				pass
+		except LexerError:
+			pass
+		seconds = time.perf_counter() - start
+		best = seconds if best is None else min(best, seconds)
+	return best
+
+def fit_exponent(sizes, seconds):
+	"""Returns the least squares slope of log(seconds) against log(sizes) - k in seconds ~ size**k"""
+	xs, ys = [math.log(size) for size in sizes], [math.log(s) for s in seconds]
+	mean_x, mean_y = sum(xs) / len(xs), sum(ys) / len(ys)
+	return sum((x - mean_x) * (y - mean_y) for x, y in zip(xs, ys)) / sum((x - mean_x) ** 2 for x in xs)
+
+def run(token_file, engine, sizes):
+	"""Prints the time per size and the growth from the previous size. Returns the fitted growth exponent."""
+	path = os.path.join(tempfile.gettempdir(), "lexer_benchmark.ml")
+	print("engine: " + engine)
+	print("%12s %12s %8s" % ("chars", "seconds", "growth"))
+	chars, times = [], []
+	for size in sizes:
+		seconds = time_lexer(create_source(size, path), token_file, engine)
+		growth = seconds / times[-1] if times else 0.0
+		chars.append(os.path.getsize(path))
+		times.append(seconds)
+		print("%12d %12.4f %8.2f" % (chars[-1], seconds, growth))
+	os.remove(path)
+	exponent = fit_exponent(chars, times)
+	print("fitted exponent: %.2f" % exponent)
+	return exponent
+
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(description = "Lexer pathological input benchmark")
+	parser.add_argument('-t', type = str, dest = 'token_file', help = "Token file", default = 'tokens.txt')
+	parser.add_argument('-e', type = str, dest = 'engines', nargs = '+', choices = ENGINES, help = "Lexer engines", default = ["regex", "dfa"])
+	parser.add_argument('-n', type = int, dest = 'rounds', help = "Number of doublings", default = 6)
+	args = parser.parse_args()
+
+	sizes = [100000 * 2 ** i for i in range(args.rounds)]
+	worst = max(run(args.token_file, engine, sizes) for engine in args.engines)
+	# linear lexing fits an exponent near 1, quadratic near 2 and exponential far above
+	if worst > 1.5:
+		print("Lexing time grew faster than the input size (fitted exponent " + str(round(worst, 2)) + ")")
+		sys.exit(1)
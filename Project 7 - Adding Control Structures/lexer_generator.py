@@ -0,0 +1,180 @@
+import argparse
+import re
+from dfa_lexer import RegexParser
+from lexer import LexerError, LexerSpec
+from vector_lexer import rule_first_chars
+
+"""
+Lexer generator for the Micro-language.
+
+Reads a token file and writes a Python module specialized for it. The module's match function
+dispatches on the first character of a token to a function that only tries the rules that can start
+with that character, in token file order. Fixed tokens like := ; ( and keywords written as a list of
+words like (True|False) are matched with str.startswith, the string rule uses the lexer's linear
+string scan, and only the other rules (ID, INTLIT, keywords with trailing context) keep a regex.
+The module has the same lexer()/Token API as lexer.py and gives the same tokens, without reading or
+compiling the token file when it is imported. It is not standalone: it imports LineIndex, Token,
+scan and scan_string from lexer.py, so lexer.py has to be importable wherever the module is used.
+
+python lexer_generator.py -t tokens.txt -o ml_lexer.py
+"""
+
+def literal_char(node):
+	"""Returns the character a ("set", source) node always matches, or None if it can match more than one"""
+	if node[0] != "set":
+		return None
+	source = node[1]
+	if len(source) == 1 and source not in ".^$*+?{}[]\\|()":
+		return source
+	if len(source) == 2 and source[0] == "\\" and not source[1].isalnum():
+		return source[1]
+	return None
+
+def literals(node):
+	"""Returns the fixed strings node matches, in the order regex alternation tries them, or None if it isn't fixed"""
+	kind = node[0]
+	if kind == "group":
+		return literals(node[2])
+	if kind == "alt":
+		words = [literals(branch) for branch in node[1]]
+		return None if None in words else [word for branch in words for word in branch]
+	if kind == "cat":
+		words = [""]
+		for item in node[1]:
+			item_words = literals(item)
+			if item_words is None:
+				return None
+			words = [word + item_word for word in words for item_word in item_words]
+		return words
+	char = literal_char(node)
+	return None if char is None else [char]
+
+def literal_prefix(node):
+	"""Returns the fixed string every match of node starts with"""
+	items = node[1] if node[0] == "cat" else [node]
+	prefix = ""
+	for item in items:
+		if item[0] == "group":
+			return prefix + literal_prefix(item[2])
+		char = literal_char(item)
+		if char is None:
+			break
+		prefix += char
+	return prefix
+
+def rule_parts(regex):
+	"""
+	Input:
+	* regex: a rule from the token file
+	Output:
+	* The fixed strings the rule matches (see literals) if it is a list of fixed strings without
+	  trailing context, otherwise None
+	* The fixed string every match of the rule starts with
+	"""
+	parser = RegexParser(regex)
+	try:
+		node = parser.parse()
+	except LexerError: # syntax the parser doesn't know - leave it to the regex
+		return None, ""
+	return literals(node) if parser.groups <= 1 else None, literal_prefix(node)
+
+def rule_code(spec, rule, words, prefix, char):
+	"""
+	Returns the lines (without indentation) that try rule at pos, where the character at pos is char
+	(None for a non-ASCII character). The lines return the match, or fall through if the rule doesn't match.
+	"""
+	if rule == spec.string_rule:
+		if char != '"':
+			return []
+		return ["end = scan_string(text, pos, endpos)",
+				"if end >= 0:",
+				"\treturn %d, pos, end" % rule]
+	if words is not None: # the lexeme is the whole match
+		lines = []
+		for word in words:
+			if word == char: # dispatch already checked it
+				return lines + ["return %d, pos, pos + 1" % rule]
+			if char is None or word.startswith(char):
+				lines.append("if text.startswith(%r, pos, endpos):" % word)
+				lines.append("\treturn %d, pos, pos + %d" % (rule, len(word)))
+		return lines
+	group = 1 if re.compile(spec.regexs[rule]).groups else 0
+	lines = ["match = R%d.match(text, pos, endpos)" % rule,
+			 "if match:",
+			 "\treturn %d, match.start(%d), match.end(%d)" % (rule, group, group)]
+	if len(prefix) > 1:
+		lines = ["if text.startswith(%r, pos, endpos):" % prefix] + ["\t" + line for line in lines]
+	return lines
+
+def generate(token_file, spec = None):
+	"""
+	Input:
+	* token_file: token file (see assignment specifications for format)
+	* spec: its LexerSpec, if it is already loaded
+	Output:
+	* The source of a lexer module for token_file, which imports its Token and scanning helpers from lexer.py
+	"""
+	spec = spec or LexerSpec.load(token_file)
+	firsts = [rule_first_chars(regex) for regex in spec.regexs]
+	parts = [rule_parts(regex) for regex in spec.regexs]
+	out = ['"""',
+		   "Lexer for " + str(token_file) + ", generated by lexer_generator.py - do not edit.",
+		   "Needs lexer.py on the import path for LineIndex, Token, scan and scan_string.",
+		   '"""',
+		   "import re",
+		   "from lexer import LineIndex, Token, scan, scan_string",
+		   "",
+		   "CLASSES = " + repr(tuple(spec.classes)),
+		   "NAMES = " + repr(tuple(spec.names)),
+		   ""]
+	for rule, (words, prefix) in enumerate(parts):
+		if words is None and rule != spec.string_rule:
+			out.append("R%d = re.compile(%r)" % (rule, spec.regexs[rule]))
+	functions = {} # function body -> function name, so characters with the same rules share a function
+	dispatch = []
+	for code in list(range(128)) + [None]:
+		char = None if code is None else chr(code)
+		body = []
+		for rule, first in enumerate(firsts):
+			if char is None or char in first:
+				body.extend(rule_code(spec, rule, parts[rule][0], parts[rule][1], char))
+				if body and body[-1].startswith("return"): # the later rules can't be reached
+					break
+		else:
+			body.append("return None")
+		body = "\n".join("\t" + line for line in body)
+		name = functions.setdefault(body, "_match_" + ("other" if char is None else "%02x" % code))
+		if char is not None:
+			dispatch.append("\t%r: %s," % (char, name))
+	other = name # the function for non-ASCII characters
+	for body, function in functions.items():
+		out += ["", "def " + function + "(text, pos, endpos):", body]
+	out += ["",
+			"DISPATCH = {",
+			*dispatch,
+			"}",
+			"",
+			"def match(text, pos, endpos):",
+			'\t"""Same as LexerSpec.match for the token file this module was generated from"""',
+			"\treturn DISPATCH.get(text[pos], " + other + ")(text, pos, endpos)",
+			"",
+			"def lexer(source_file, token_file = None):",
+			'\t"""Same as lexer.lexer for the token file this module was generated from (token_file is ignored)"""',
+			'\twith open(source_file, "r") as src:',
+			"\t\ttext = src.read()",
+			"\tindex = LineIndex(text)",
+			"\tlexemes = {} # repeated lexemes (keywords, identifiers) share one string",
+			"\tfor rule, start, end in scan(text, match, index = index):",
+			"\t\tpattern = text[start:end]",
+			"\t\tyield Token(CLASSES[rule], NAMES[rule], lexemes.setdefault(pattern, pattern), offset = start, index = index)",
+			""]
+	return "\n".join(out)
+
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(description = "Micro-language lexer generator")
+	parser.add_argument('-t', type = str, dest = 'token_file', help = "Token file", default = 'tokens.txt')
+	parser.add_argument('-o', type = str, dest = 'output_file', help = "Generated module", default = 'ml_lexer.py')
+	args = parser.parse_args()
+
+	with open(args.output_file, "w") as out:
+		out.write(generate(args.token_file))
@@ -0,0 +1,483 @@
+import asyncio
+import async_lexer
+import dfa_lexer
+import importlib.util
+import lexer
+import lexer_generator
+import os
+import parallel_lexer
+import re
+import tempfile
+import unittest
+import vector_lexer
+
+def create_file(str_list, file = "lexer_test.ml"):
+	path = os.path.join(tempfile.gettempdir(), file)
+	with open(path, "w") as fp:
+		fp.write("\n".join(str_list) + "\n")
+	return path
+
+def lex(L, token_file = "tokens.txt", **options):
+	return [(t.t_class, t.name, t.pattern, t.line_num, t.col) for t in lexer.lexer(create_file(L), token_file, **options)]
+
+
+class LexerTester(unittest.TestCase):
+
+	def test01_basic(self):
+		"""First token of a line"""
+		G = lexer.lexer(create_file(["begin"]), "tokens.txt")
+		self.assertTrue(next(G) == lexer.Token("RESERVED", "BEGIN", "begin", "begin", 1, 0))
+		with self.assertRaises(StopIteration):
+			next(G)
+
+	def test02_rule_order(self):
+		"""Rules are tried in token file order"""
+		self.assertEqual(lex(["begin beginx :=x"]), [("RESERVED", "BEGIN", "begin", 1, 0),
+			("IDENTIFIER", "ID", "beginx", 1, 6), ("SYMBOL", "ASSIGNOP", ":=", 1, 13), ("IDENTIFIER", "ID", "x", 1, 15)])
+
+	def test03_comment(self):
+		"""Comments run to the end of the line"""
+		self.assertEqual(lex(["x # := %", "  y"]), [("IDENTIFIER", "ID", "x", 1, 0), ("IDENTIFIER", "ID", "y", 2, 2)])
+
+	def test04_LexerError(self):
+		"""Bad tokens report their line and column"""
+		G = lexer.lexer(create_file(["begin", "  ab$cd"]), "tokens.txt")
+		next(G)
+		next(G)
+		with self.assertRaisesRegex(lexer.LexerError, "line 2 column 4"):
+			next(G)
+
+
+	def test05_dfa_same_tokens(self):
+		"""The DFA lexer agrees with the regex lexer on ordinary programs"""
+		L = ["begin", "  int x;", "  x := (3 + -4) * 5 % 2; # comment", "  if x >= 2 and not True then", "  write(\"a b\\n\", x);", "end"]
+		self.assertEqual(lex(L, engine = "dfa"), lex(L))
+
+	def test06_dfa_longest_match(self):
+		"""Longest match keeps keyword prefixes inside identifiers"""
+		self.assertEqual(lex(["android strings begin"], engine = "dfa"), [("IDENTIFIER", "ID", "android", 1, 0),
+			("IDENTIFIER", "ID", "strings", 1, 8), ("RESERVED", "BEGIN", "begin", 1, 16)])
+
+	def test07_dfa_LexerError(self):
+		"""The DFA lexer reports bad tokens like the regex lexer"""
+		G = lexer.lexer(create_file(["x := $"]), "tokens.txt", engine = "dfa")
+		next(G)
+		next(G)
+		with self.assertRaisesRegex(lexer.LexerError, "line 1 column 5"):
+			next(G)
+
+	def test08_dfa_cache(self):
+		"""DFA tables are cached by token file content"""
+		spec = lexer.LexerSpec.load("tokens.txt")
+		path = lexer.cache_file("tokens.txt", spec.digest, ".dfa.json")
+		dfa_lexer.load_tables(spec)
+		self.assertTrue(os.path.exists(path))
+		self.assertEqual(dfa_lexer.load_tables("tokens.txt").match("beginx", 0, 6), (34, 0, 6))
+
+
+	def test09_string_literal(self):
+		"""String literals hold word characters, whitespace and backslashes"""
+		self.assertEqual(lex(['write("a b\\n", "");']), [("RESERVED", "WRITE", "write", 1, 0), ("SYMBOL", "LPAREN", "(", 1, 5),
+			("LITERAL", "STRINGLIT", '"a b\\n"', 1, 6), ("SYMBOL", "COMMA", ",", 1, 13), ("LITERAL", "STRINGLIT", '""', 1, 15),
+			("SYMBOL", "RPAREN", ")", 1, 17), ("SYMBOL", "SEMICOLON", ";", 1, 18)])
+
+	def test10_unterminated_string(self):
+		"""A long unterminated literal fails fast instead of backtracking exponentially"""
+		for engine in ("regex", "dfa"):
+			G = lexer.lexer(create_file(['x := "' + "a" * 100000 + "!"]), "tokens.txt", engine = engine)
+			next(G)
+			next(G)
+			with self.assertRaisesRegex(lexer.LexerError, "line 1 column 5"):
+				next(G)
+
+
+	def test11_spec_reuse(self):
+		"""A LexerSpec is loaded once and can lex any number of files"""
+		spec = lexer.LexerSpec.load("tokens.txt")
+		self.assertTrue(lexer.LexerSpec.load("tokens.txt") is spec)
+		self.assertTrue(os.path.exists(lexer.cache_file("tokens.txt", spec.digest, ".spec.pickle")))
+		self.assertEqual(lex(["x := 1;"], spec), lex(["x := 1;"]))
+		self.assertEqual(lex(["begin end"], spec, engine = "dfa"), lex(["begin end"]))
+
+	def test12_spec_from_columns(self):
+		"""A LexerSpec can be built straight from the token file columns"""
+		spec = lexer.LexerSpec(["SYMBOL", "IDENTIFIER"], ["PLUS", "ID"], ["(\\+)", "([a-z]+)"])
+		self.assertEqual(lex(["a+b"], spec), [("IDENTIFIER", "ID", "a", 1, 0), ("SYMBOL", "PLUS", "+", 1, 1),
+			("IDENTIFIER", "ID", "b", 1, 2)])
+		# a STRINGLIT rule that isn't the ML string regex is lexed with its own regex
+		spec = lexer.LexerSpec(["LITERAL", "IDENTIFIER"], ["STRINGLIT", "ID"], [r'(\"[^\"]*\")', "([a-z]+)"])
+		self.assertIsNone(spec.string_rule)
+		for engine in ("regex", "keywords", "vector", "dfa"):
+			self.assertEqual(lex(['"hi!" x'], spec, engine = engine), [("LITERAL", "STRINGLIT", '"hi!"', 1, 0), ("IDENTIFIER", "ID", "x", 1, 6)])
+
+
+	def test13_offsets(self):
+		"""Tokens know their full line, and long lines are lexed without slicing"""
+		tokens = list(lexer.lexer(create_file(["  x := 1;" * 20000]), "tokens.txt"))
+		self.assertEqual(len(tokens), 80000)
+		self.assertTrue(tokens[0].line == tokens[-1].line == ("  x := 1;" * 20000).rstrip())
+		self.assertEqual((tokens[-1].line_num, tokens[-1].col), (1, 9 * 20000 - 1))
+
+	def test14_line_index(self):
+		"""LineIndex turns offsets into lines and columns"""
+		index = lexer.LineIndex("begin\n  x;  \n\nend")
+		self.assertEqual(index.starts, [0, 6, 13, 14])
+		self.assertEqual(index.position(8), (2, 2))
+		self.assertEqual(index.position(14), (4, 0))
+		self.assertEqual(index.line(2), "  x;")
+
+
+	def test15_compact_token(self):
+		"""Lexer tokens are slotted and work out their position from the offset"""
+		t1, t2, t3, t4 = lexer.lexer(create_file(["begin", "  xy := 12"]), "tokens.txt")
+		self.assertFalse(hasattr(t2, "__dict__"))
+		self.assertEqual((t2.offset, t2.length, t2.line, t2.line_num, t2.col), (8, 2, "  xy := 12", 2, 2))
+		self.assertTrue(t1.name is lexer.LexerSpec.load("tokens.txt").names[0])
+		self.assertTrue(t2 == lexer.Token("IDENTIFIER", "ID", "xy", "  xy := 12", 2, 2))
+		self.assertFalse(t2 == t3)
+
+
+	def test16_tokenize_all(self):
+		"""tokenize_all returns the token stream as parallel arrays"""
+		path = create_file(["begin", "  x := x + 1; # done", "end"])
+		arrays = lexer.tokenize_all(path, "tokens.txt")
+		self.assertEqual(len(arrays), 8)
+		self.assertEqual(arrays.kinds.typecode + arrays.offsets.typecode + arrays.lengths.typecode, "HII")
+		self.assertEqual(arrays.lexemes, ["begin", "x", ":=", "+", "1", ";", "end"])
+		self.assertEqual(list(arrays.lexeme_ids), [0, 1, 2, 1, 3, 4, 5, 6])
+		self.assertEqual(arrays.kinds[6], arrays.kind_ids["SEMICOLON"])
+		self.assertEqual((arrays.offsets[6], arrays.lengths[6]), (18, 1))
+		self.assertEqual(list(arrays), list(lexer.lexer(path, "tokens.txt")))
+		self.assertEqual(list(lexer.tokenize_all(path, "tokens.txt", engine = "dfa")), list(arrays))
+
+
+	def test17_relex(self):
+		"""relex only lexes the edited lines and matches a full lex of the edited text"""
+		arrays = lexer.tokenize_text("begin\n  x := 1;\n  write(x);\nend\n", "tokens.txt")
+		lexer.relex(arrays, 8, 1, "count := 12 +\n  y", "tokens.txt")
+		expected = lexer.tokenize_text("begin\n  count := 12 +\n  y := 1;\n  write(x);\nend\n", "tokens.txt")
+		self.assertEqual(arrays.text, expected.text)
+		self.assertEqual(list(arrays), list(expected))
+		self.assertEqual(list(arrays.index.starts), expected.index.starts)
+
+		# edits before, after and far from the previous one, which shift the tokens after them differently
+		text = "begin\n" + "  x := x + 1;\n" * 50 + "end\n"
+		arrays = lexer.tokenize_text(text, "tokens.txt")
+		for offset, deleted, inserted in [(400, 1, "yy"), (100, 3, ""), (500, 0, "\n  z := 2;"), (20, 0, "ab"), (7, 10, ""), (600, 2, "12")]:
+			lexer.relex(arrays, offset, deleted, inserted, "tokens.txt")
+			text = text[:offset] + inserted + text[offset + deleted:]
+			expected = lexer.tokenize_text(text, "tokens.txt")
+			self.assertEqual(list(arrays), list(expected))
+			self.assertEqual((list(arrays.offsets), list(arrays.index.starts)), (list(expected.offsets), expected.index.starts))
+
+	def test18_relex_LexerError(self):
+		"""A bad edit raises a LexerError and leaves the arrays alone"""
+		arrays = lexer.tokenize_text("begin\n  x := 1;\nend\n", "tokens.txt")
+		with self.assertRaisesRegex(lexer.LexerError, "line 2 column 7"):
+			lexer.relex(arrays, 13, 0, "$", "tokens.txt")
+		self.assertEqual([arrays.lexeme(i) for i in range(len(arrays))], ["begin", "x", ":=", "1", ";", "end"])
+
+
+	def test19_parallel(self):
+		"""Lexing in several processes gives the same tokens and the same first error"""
+		minimum, parallel_lexer.MIN_CHUNK = parallel_lexer.MIN_CHUNK, 64
+		try:
+			L = ["begin"] + ["  x%d := x + %d; # line %d" % (i, i, i) for i in range(200)] + ["end"]
+			path = create_file(L)
+			arrays = lexer.tokenize_all(path, "tokens.txt", processes = 3)
+			self.assertEqual(list(arrays), list(lexer.tokenize_all(path, "tokens.txt")))
+			self.assertEqual(list(lexer.lexer(path, "tokens.txt", engine = "dfa", processes = 2)), list(arrays))
+
+			L[150] = "  x := $;"
+			L[180] = "$"
+			path = create_file(L)
+			with self.assertRaisesRegex(lexer.LexerError, "line 151 column 7"):
+				lexer.tokenize_all(path, "tokens.txt", processes = 3)
+			tokens = []
+			with self.assertRaises(lexer.LexerError):
+				for token in lexer.lexer(path, "tokens.txt", processes = 3):
+					tokens.append(token)
+			self.assertEqual(len(tokens), 1 + 149 * 6 + 2)
+		finally:
+			parallel_lexer.MIN_CHUNK = minimum
+
+	def test20_keyword_table(self):
+		"""Keywords are looked up after the identifier rule matches and keep their own class and name"""
+		spec = lexer.LexerSpec.load("tokens.txt")
+		self.assertEqual(spec.keyword_table()["while"], (34, 6))
+		self.assertEqual(spec.keyword_table()["False"], (34, 12))
+		L = ["begin", "  if True and x then write(\"hi\");", "  android := notes or beginning;", "end"]
+		path = create_file(L)
+		tokens = list(lexer.lexer(path, "tokens.txt", engine = "keywords"))
+		self.assertEqual([(t.name, t.pattern) for t in tokens[:5]],
+			[("BEGIN", "begin"), ("IF", "if"), ("BOOLLIT", "True"), ("AND", "and"), ("ID", "x")])
+		self.assertEqual([(t.name, t.pattern) for t in tokens[11:17]],
+			[("ID", "android"), ("ASSIGNOP", ":="), ("ID", "notes"), ("OR", "or"), ("ID", "beginning"), ("SEMICOLON", ";")])
+		L = ["begin", "  while x < 10 do", "    x := x + 1;", "  write(x, \"a b\");", "end"]
+		path = create_file(L)
+		self.assertEqual(list(lexer.tokenize_all(path, "tokens.txt", engine = "keywords")), list(lexer.tokenize_all(path, "tokens.txt")))
+
+	def test21_stream(self):
+		"""Tokens and lines split between pieces of a stream lex like the whole file"""
+		L = ["begin", "  write(\"héllo\", count);", "  count := count + 12;", "end"]
+		path = create_file(L)
+		data = "\n".join(L).encode("utf-8")
+		pieces = [data[i:i + 3] for i in range(0, len(data), 3)]
+		tokens = list(lexer.lexer_stream(pieces, "tokens.txt"))
+		self.assertEqual(tokens, list(lexer.lexer(path, "tokens.txt")))
+		self.assertEqual([t.offset for t in tokens], [t.offset for t in lexer.lexer(path, "tokens.txt")])
+		with open(path) as fp:
+			self.assertEqual(list(lexer.lexer(fp, "tokens.txt", engine = "dfa")), tokens)
+
+		stream = lexer.StreamLexer("tokens.txt")
+		self.assertEqual([t.pattern for t in stream.feed("begin\n  x := 1")], ["begin"])
+		self.assertEqual([t.pattern for t in stream.feed("2;\n  $")], ["x", ":=", "12", ";"])
+		with self.assertRaisesRegex(lexer.LexerError, "line 3 column 2") as error:
+			list(stream.close())
+		self.assertEqual(error.exception.offset, 19)
+
+		path = os.path.join(tempfile.gettempdir(), "lexer_test_crlf.ml")
+		with open(path, "wb") as fp:
+			fp.write(b"begin\r\n  x := 1;\r\n\r  write(x)\r\nend\r\n")
+		expected = [(t.pattern, t.offset, t.line_num, t.col) for t in lexer.lexer(path, "tokens.txt")]
+		self.assertEqual(expected[-1], ("end", 28, 5, 0)) # newlines are translated like a file read in text mode
+		with open(path, "rb") as fp:
+			self.assertEqual([(t.pattern, t.offset, t.line_num, t.col) for t in lexer.lexer(fp, "tokens.txt")], expected)
+		with open(path, "rb") as fp:
+			data = fp.read()
+		for pieces in ([data[i:i + 1] for i in range(len(data))], [data.decode()[i:i + 1] for i in range(len(data))]):
+			self.assertEqual([(t.pattern, t.offset, t.line_num, t.col) for t in lexer.lexer_stream(pieces, "tokens.txt")], expected)
+
+		line = "x := x + 1; " * 20000 # one long line in many pieces
+		stream = lexer.StreamLexer("tokens.txt")
+		tokens = [token for i in range(0, len(line), 7) for token in stream.feed(line[i:i + 7])]
+		tokens += stream.close()
+		self.assertEqual(len(tokens), 120000)
+		last = tokens[-1]
+		self.assertEqual((last.line_num, last.col, last.offset, len(last.line)), (1, len(line) - 2, len(line) - 2, len(line) - 1))
+
+	def test22_recovery(self):
+		"""Recovery mode skips every run of bad characters, records it and keeps lexing"""
+		L = ["begin", "  x := 1 $$ + 2;", "  write(x)@;", "end ~"]
+		path = create_file(L)
+		errors = []
+		tokens = list(lexer.lexer(path, "tokens.txt", errors = errors))
+		self.assertEqual([t.pattern for t in tokens], ["begin", "x", ":=", "1", "+", "2", ";", "write", "(", "x", ")", ";", "end"])
+		self.assertEqual([(e.line_num, e.col, e.offset) for e in errors], [(2, 9, 15), (3, 10, 33), (4, 4, 40)])
+		self.assertEqual(str(errors[0]), "Lexical Error: invalid token - line 2 column 9")
+
+		G = lexer.lexer(path, "tokens.txt", engine = "dfa", errors = [])
+		with self.assertRaises(StopIteration) as done:
+			while True:
+				next(G)
+		self.assertEqual(len(done.exception.value), 3)
+		self.assertEqual(len(lexer.tokenize_all(path, "tokens.txt", errors = [])), len(tokens))
+
+	def test23_vector(self):
+		"""The vector engine gives the regex engine's tokens and only caches word local token files"""
+		L = ["begin", "  android := beginning and True;", "  if x1 == 12 then write(\"a b\", x1) # end", "  x1 := 3a + é;", "end"]
+		path = create_file(L)
+		self.assertEqual(list(lexer.lexer(path, "tokens.txt", engine = "vector", errors = [])), list(lexer.lexer(path, "tokens.txt", errors = [])))
+		matcher = vector_lexer.VectorMatcher("tokens.txt")
+		self.assertTrue(matcher.word_local)
+		spec = lexer.LexerSpec.load("tokens.txt")
+		first, second = lexer.engine_match(spec, "vector"), lexer.engine_match(spec, "vector")
+		self.assertTrue(first is not second and first.rules is second.rules) # every lex has its own pre-pass
+		a, b = "begin x1 := y and 2;\nwrite(x1) end\n", "android := 3 + x1;\n"
+		together = list(zip(lexer.scan(a, first), lexer.scan(b, second))) # two lexes at once
+		self.assertEqual(together, list(zip(lexer.scan(a, spec.match), lexer.scan(b, spec.match))))
+		self.assertEqual(list(lexer.scan(a, first)), list(lexer.scan(a, spec.match))) # the same text again
+		self.assertTrue(0 < len(first.cache) <= vector_lexer.CACHE_SIZE and first.cache is not second.cache)
+		self.assertEqual(vector_lexer.rule_kind(r"(begin)(\W|$)"), "word")
+		self.assertEqual(vector_lexer.rule_kind(r"(\:=)"), "other")
+		self.assertEqual(vector_lexer.rule_kind(r"(\d+\.\d+)"), None)
+		self.assertEqual(vector_lexer.rule_kind(r"(a)(\W\W)"), None)
+
+	@unittest.skipUnless(vector_lexer.numpy, "NumPy is not installed")
+	def test24_vector_word_runs(self):
+		"""The NumPy pre-pass finds the same word runs as a regex"""
+		text = "begin\n  x_1 := é12 + ab;\t# c\n"
+		starts, ends = vector_lexer.word_runs(text)
+		runs = list(re.finditer(r"[A-Za-z0-9_]+", text))
+		self.assertEqual((list(starts), list(ends)), ([run.start() for run in runs], [run.end() for run in runs]))
+
+	def test25_generated_lexer(self):
+		"""The generated lexer module gives the same tokens and errors as the regex engine"""
+		path = os.path.join(tempfile.gettempdir(), "ml_lexer_test.py")
+		with open(path, "w") as fp:
+			fp.write(lexer_generator.generate("tokens.txt"))
+		module_spec = importlib.util.spec_from_file_location("ml_lexer_test", path)
+		ml_lexer = importlib.util.module_from_spec(module_spec)
+		module_spec.loader.exec_module(ml_lexer)
+
+		L = ["begin", "  android := beginning and True;", "  if x1 >= 12 then write(\"a b\", x1) # end", "  x1 := (x - 3) * 2;", "end"]
+		path = create_file(L)
+		self.assertEqual(list(ml_lexer.lexer(path, "tokens.txt")), list(lexer.lexer(path, "tokens.txt")))
+		text = "beginx \"x1=é_a\"a b\"intor!\"Tr3aFalseynot := \"unterminated"
+		errors, expected = [], []
+		self.assertEqual(list(lexer.scan(text, ml_lexer.match, errors = errors)), list(lexer.scan(text, lexer.LexerSpec.load("tokens.txt").match, errors = expected)))
+		self.assertEqual([e.offset for e in errors], [e.offset for e in expected])
+		self.assertEqual(lexer_generator.literals(dfa_lexer.RegexParser("(True|False)").parse()), ["True", "False"])
+
+		# a string rule first: a non-ASCII character has no lines for it
+		spec = lexer.LexerSpec(["LITERAL", "IDENTIFIER"], ["STRINGLIT", "ID"], [lexer.STRING_REGEX, "(\\w+)"])
+		path = os.path.join(tempfile.gettempdir(), "string_lexer_test.py")
+		with open(path, "w") as fp:
+			fp.write(lexer_generator.generate("strings.txt", spec))
+		module_spec = importlib.util.spec_from_file_location("string_lexer_test", path)
+		string_lexer = importlib.util.module_from_spec(module_spec)
+		module_spec.loader.exec_module(string_lexer)
+		text = '"a b" é1 "c"'
+		self.assertEqual(list(lexer.scan(text, string_lexer.match)), list(lexer.scan(text, spec.match)))
+
+	def test26_token_file(self):
+		"""A saved TokenArrays loads back the same, and tokenize_all(cache=True) reuses it"""
+		L = ["begin", "  x := 12; # é", "  write(x, \"é b\");", "end"]
+		path = create_file(L)
+		arrays = lexer.tokenize_all(path, "tokens.txt")
+		token_path = os.path.join(tempfile.gettempdir(), "lexer_test.tokens")
+		arrays.save(token_path)
+		loaded = lexer.TokenArrays.load(token_path)
+		self.assertIsInstance(loaded.offsets, memoryview)
+		self.assertEqual(list(loaded), list(arrays))
+		self.assertEqual((loaded.text, loaded.names, loaded.lexemes), (arrays.text, arrays.names, arrays.lexemes))
+		self.assertEqual(list(loaded.lengths), list(arrays.lengths))
+
+		loaded = lexer.TokenArrays.load(token_path, copy = True)
+		lexer.relex(loaded, 8, 1, "count", "tokens.txt")
+		self.assertEqual(loaded.lexeme(1), "count")
+
+		with open(token_path, "wb") as fp:
+			fp.write(b"begin")
+		with self.assertRaisesRegex(lexer.LexerError, "not a token file"):
+			lexer.TokenArrays.load(token_path)
+
+		cached = lexer.tokenize_all(path, "tokens.txt", cache = True)
+		self.assertEqual(list(cached), list(arrays))
+		for engine in ["regex", "dfa"]: # hits can be relexed like misses
+			hit = lexer.tokenize_all(path, "tokens.txt", engine = engine, cache = True)
+			self.assertEqual(list(hit), list(arrays))
+			lexer.relex(hit, 8, 1, "count", "tokens.txt")
+			self.assertEqual(hit.lexeme(1), "count")
+
+		# one token file per source and engine: an edited source replaces its token file
+		path = create_file(["begin", "  y := 1;", "end"], "lexer_cache_test.ml")
+		self.assertEqual(len(lexer.tokenize_all(path, "tokens.txt", cache = True)), 6)
+		cache_dir = os.path.join(os.path.dirname(path), lexer.CACHE_DIR)
+		files = len(os.listdir(cache_dir))
+		for n in range(3):
+			create_file(["begin"] + ["  y := %d;" % n] * (n + 2) + ["end"], "lexer_cache_test.ml")
+			self.assertEqual(len(lexer.tokenize_all(path, "tokens.txt", cache = True)), 4 * (n + 2) + 2)
+			self.assertEqual(len(os.listdir(cache_dir)), files)
+
+		limit = lexer.TOKEN_FILE_LIMIT
+		lexer.TOKEN_FILE_LIMIT = 10
+		try:
+			with self.assertRaisesRegex(lexer.LexerError, "too large"):
+				arrays.save(token_path)
+			self.assertEqual(len(lexer.tokenize_all(path, "tokens.txt", engine = "dfa", cache = True)), 18) # not cached
+		finally:
+			lexer.TOKEN_FILE_LIMIT = limit
+		self.assertEqual(len(os.listdir(cache_dir)), files)
+
+	def test27_stats(self):
+		"""Instrumented lexing gives the same tokens and counts every rule's attempts and matches"""
+		L = ["begin", "  x := 1;", "  write(\"a\");", "end"]
+		path = create_file(L)
+		stats = lexer.LexerStats("tokens.txt")
+		self.assertEqual(list(lexer.lexer(path, "tokens.txt", stats = stats)), list(lexer.lexer(path, "tokens.txt")))
+		with open(path, "rb") as fp: # a stream source is instrumented too
+			stream_stats = lexer.LexerStats("tokens.txt")
+			self.assertEqual(list(lexer.lexer(fp, "tokens.txt", stats = stream_stats)), list(lexer.lexer(path, "tokens.txt")))
+		attempts_and_matches = lambda stats: [(count["attempts"], count["matches"]) for count in stats.as_dict().values()]
+		self.assertEqual(attempts_and_matches(stream_stats), attempts_and_matches(stats))
+		other = lexer.LexerSpec(["SYMBOL"], ["PLUS"], ["(\\+)"])
+		for options in [{"stats": lexer.LexerStats(other)}, {"stats": stats, "processes": 2}, {"errors": [], "processes": 2}]:
+			with self.assertRaises(ValueError):
+				list(lexer.lexer(path, "tokens.txt", **options))
+		with self.assertRaises(ValueError):
+			list(lexer.lexer(["begin"], "tokens.txt", processes = 2))
+		with self.assertRaises(ValueError):
+			lexer.tokenize_all(path, "tokens.txt", errors = [], processes = 2)
+		counts = stats.as_dict()
+		self.assertEqual((counts["BEGIN"]["attempts"], counts["BEGIN"]["matches"]), (11, 1))
+		self.assertEqual((counts["ID"]["attempts"], counts["ID"]["matches"]), (1, 1))
+		self.assertEqual(counts["STRINGLIT"]["matches"], 1)
+		self.assertEqual(sum(count["matches"] for count in counts.values()), 11)
+		self.assertGreater(counts["BEGIN"]["seconds"], 0)
+		self.assertEqual(str(stats).splitlines()[0].split(), ["rule", "attempts", "matches", "seconds", "us/attempt"])
+
+	def test28_async_lexer(self):
+		"""The async lexer gives lexer()'s tokens and lets other tasks run while it lexes"""
+		L = ["begin"] + ["  x%d := x + %d;" % (i, i) for i in range(100)] + ["end"]
+		path = create_file(L)
+
+		async def lex_and_count():
+			ticks = 0
+			async def ticker():
+				nonlocal ticks
+				while True:
+					ticks += 1
+					await asyncio.sleep(0)
+			task = asyncio.ensure_future(ticker())
+			tokens = [token async for token in async_lexer.async_lexer(path, "tokens.txt", chunk_size = 64, yield_every = 10)]
+			task.cancel()
+			reader = asyncio.StreamReader()
+			reader.feed_data("\n".join(L).encode("utf-8"))
+			reader.feed_eof()
+			return tokens, ticks, [token async for token in async_lexer.async_lexer(reader, "tokens.txt")]
+
+		tokens, ticks, read_tokens = asyncio.run(lex_and_count())
+		self.assertEqual(tokens, list(lexer.lexer(path, "tokens.txt")))
+		self.assertEqual(read_tokens, tokens)
+		self.assertGreater(ticks, 50)
+
+		path = os.path.join(tempfile.gettempdir(), "lexer_test_crlf.ml") # the file is read as bytes
+		with open(path, "wb") as fp:
+			fp.write("\r\n".join(L).encode("utf-8"))
+		async def lex_crlf():
+			return [(t.pattern, t.offset, t.line_num, t.col) async for t in async_lexer.async_lexer(path, "tokens.txt", chunk_size = 7)]
+		self.assertEqual(asyncio.run(lex_crlf()), [(t.pattern, t.offset, t.line_num, t.col) for t in lexer.lexer(path, "tokens.txt")])
+
+	def test29_token_stream(self):
+		"""A token stream looks ahead, ends with EOF tokens and throws a bad token only when it gets to it"""
+		path = create_file(["begin", "  x := 1;", "end"])
+		G = lexer.token_stream(path, "tokens.txt")
+		self.assertEqual((G.peek().pattern, G.peek(2).pattern, G.peek(6).name), ("begin", ":=", "EOF"))
+		self.assertEqual([G.advance().pattern for i in range(6)], ["begin", "x", ":=", "1", ";", "end"])
+		self.assertFalse(G.at_eof)
+		self.assertEqual((G.advance().name, G.advance().name), ("EOF", "EOF"))
+		self.assertTrue(G.at_eof)
+		self.assertEqual((G.eof.line_num, G.eof.col), (4, 0))
+		pieces = iter([b"begin\r\n  x :", b"= 1;\nend"]) # lexed as the pieces arrive
+		G = lexer.token_stream(pieces, "tokens.txt")
+		self.assertEqual([(t.pattern, t.offset) for t in G.tokens], [("begin", 0), ("x", 8), (":=", 10), ("1", 13), (";", 14), ("end", 16)])
+		self.assertEqual((G.eof.offset, G.eof.line_num, G.eof.col), (19, 3, 3))
+		G = lexer.token_stream(["begin\n  x := $;\n", "end\n"], "tokens.txt")
+		self.assertEqual([G.advance().pattern for i in range(3)], ["begin", "x", ":="])
+		with self.assertRaisesRegex(lexer.LexerError, "line 2 column 7"):
+			G.peek()
+
+		path = create_file(["begin", "  x := $;", "end"])
+		G = lexer.token_stream(path, "tokens.txt")
+		self.assertEqual([G.advance().pattern for i in range(3)], ["begin", "x", ":="])
+		with self.assertRaisesRegex(lexer.LexerError, "line 2 column 7"):
+			G.peek()
+		G = lexer.TokenStream(lexer.tokenize_text("begin end", "tokens.txt"), None)
+		self.assertEqual(G.peek(1).name, "END")
+
+	def test30_unknown_engine(self):
+		"""An unknown engine is a ValueError, not the regex engine"""
+		path = create_file(["begin", "end"])
+		with self.assertRaisesRegex(ValueError, "unknown lexer engine 'DFA'"):
+			list(lexer.lexer(path, "tokens.txt", engine = "DFA"))
+		with self.assertRaises(ValueError):
+			list(lexer.lexer(["begin end"], "tokens.txt", engine = "DFA"))
+		with self.assertRaises(ValueError):
+			lexer.tokenize_all(path, "tokens.txt", engine = "DFA", cache = True)
+		with self.assertRaises(ValueError):
+			lexer.token_stream(path, "tokens.txt", engine = "DFA")
+
+
+if __name__ == "__main__":
+	unittest.main()
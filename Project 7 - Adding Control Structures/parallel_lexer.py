@@ -0,0 +1,85 @@
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from lexer import LexerError, TokenArrays, engine_match, load_spec, scan
+
+"""
+Lexes one large source in several processes at once.
+
+Tokens never span a newline and every line is lexed on its own, so the source is cut into chunks at
+line boundaries and each chunk is lexed by a worker process. The chunks come back in order and are
+stitched into one TokenArrays with offsets into the whole source, so line numbers and columns are the
+same as a one process lex. A bad token is reported from the first chunk that has one, so the error
+is the same one the one process lexer would throw.
+"""
+
+CHUNKS_PER_PROCESS = 4 # more chunks than processes evens out the work when some chunks are slower
+MIN_CHUNK = 1 << 16 # smaller chunks cost more to send to a worker than to lex
+
+_worker = {} # the match function of each worker process, set up once by init_worker
+
+def init_worker(spec, engine):
+	_worker["match"] = engine_match(spec, engine)
+
+def lex_chunk(chunk):
+	"""
+	Worker: lexes one chunk of the source (which starts at the start of a line).
+	Returns the kinds, chunk relative offsets, lengths and chunk local lexeme ids of its tokens,
+	the chunk's lexeme table, and the chunk relative offset of the first bad token (-1 if none).
+	"""
+	kinds, offsets, lengths, lexeme_ids = array("H"), array("I"), array("I"), array("I")
+	lexemes, lexeme_table = [], {}
+	error = -1
+	try:
+		for rule, start, end in scan(chunk, _worker["match"]):
+			pattern = chunk[start:end]
+			lexeme_id = lexeme_table.get(pattern)
+			if lexeme_id is None:
+				lexeme_id = lexeme_table[pattern] = len(lexemes)
+				lexemes.append(pattern)
+			kinds.append(rule)
+			offsets.append(start)
+			lengths.append(end - start)
+			lexeme_ids.append(lexeme_id)
+	except LexerError as e:
+		error = e.offset
+	return kinds, offsets, lengths, lexeme_ids, lexemes, error
+
+def split_lines(text, count):
+	"""Returns the start offsets of about count chunks of text, each starting at the start of a line"""
+	size = max(MIN_CHUNK, len(text) // count + 1)
+	starts = [0]
+	while True:
+		newline = text.find("\n", starts[-1] + size)
+		if newline < 0 or newline + 1 >= len(text):
+			return starts
+		starts.append(newline + 1)
+
+def parallel_tokenize(text, token_file, engine = "regex", processes = 2):
+	"""
+	Input:
+	* text: the content to be tokenized
+	* token_file: token file (see assignment specifications for format), or a LexerSpec
+	* engine: "regex" or "dfa" (see lexer.lexer)
+	* processes: the number of worker processes
+	Output:
+	* The TokenArrays of text, holding every token before the first bad token if there is one
+	* The LexerError for the first bad token, or None
+	"""
+	spec = load_spec(token_file)
+	starts = split_lines(text, processes * CHUNKS_PER_PROCESS)
+	bounds = list(zip(starts, starts[1:] + [len(text)]))
+	with ProcessPoolExecutor(max_workers = processes, initializer = init_worker, initargs = (spec, engine)) as pool:
+		results = pool.map(lex_chunk, (text[start:end] for start, end in bounds))
+
+		arrays = TokenArrays(text, spec.classes, spec.names)
+		for (start, end), (kinds, offsets, lengths, lexeme_ids, lexemes, error) in zip(bounds, results):
+			local_ids = [arrays.lexeme_id(lexeme) for lexeme in lexemes]
+			arrays.kinds.extend(kinds)
+			arrays.offsets.extend(map(start.__add__, offsets))
+			arrays.lengths.extend(lengths)
+			arrays.lexeme_ids.extend(map(local_ids.__getitem__, lexeme_ids))
+			if error >= 0:
+				pool.shutdown(wait = False, cancel_futures = True) # the chunks after this one aren't needed
+				line_num, col = arrays.index.position(start + error)
+				return arrays, LexerError("Lexical Error: invalid token - line " + str(line_num) + " column " + str(col), start + error, line_num, col)
+	return arrays, None
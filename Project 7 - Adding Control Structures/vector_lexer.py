@@ -0,0 +1,249 @@
+import bisect
+import re
+import string
+from array import array
+from dfa_lexer import RegexParser
+from lexer import LexerError, build_master_regex, load_spec
+
+try:
+	import numpy
+except ImportError: # the runs are found with a regex instead
+	numpy = None
+
+r"""
+Lexer match function with a vectorized character class pre-pass.
+
+Every character of the source is first marked as a word character (letters, digits and _) or not with
+one NumPy table lookup, and the runs of word characters are found from the transitions - two arrays
+of run starts and ends, walked with a cursor as the lexer moves forward. Most tokens of a program
+start a run - keywords, identifiers and numbers - and when every rule of the token file is word local
+(see rule_kind) the token found at the start of a run only depends on the run and the character after
+it. So each distinct run is lexed by the regex engine once and every other occurrence is a dictionary
+lookup, in a cache that belongs to the lex and is cleared when it reaches CACHE_SIZE runs. The regex
+engine still runs everywhere else: operators, quotes, # and non-ASCII text. There it only tries the
+rules that can start with the character at hand, which is much cheaper than the master regex of every
+rule.
+
+Without NumPy the runs are found with a regex, which gives the same tokens.
+"""
+
+WORD_CHARS = string.ascii_letters + string.digits + "_"
+
+# the most distinct runs a lex keeps in its cache - a file of unique identifiers would otherwise cache them all
+CACHE_SIZE = 1 << 14
+
+# 1 for every ASCII word character, with one more entry (0) for everything past ASCII
+WORD_TABLE = [int(chr(code) in WORD_CHARS) for code in range(128)] + [0]
+
+def word_runs(text):
+	"""
+	Returns the starts and the ends of the runs of ASCII word characters in text, as two ascending sequences
+	of ints (memoryviews of NumPy arrays, or arrays without NumPy)
+	"""
+	if numpy is None:
+		starts, ends = array("q"), array("q")
+		for run in re.finditer("[" + WORD_CHARS + "]+", text):
+			starts.append(run.start())
+			ends.append(run.end())
+		return starts, ends
+	codes = numpy.frombuffer(text.encode("utf-32-le"), dtype = numpy.uint32) # one code point per character
+	word = numpy.array(WORD_TABLE, dtype = numpy.int8)[numpy.minimum(codes, 128)]
+	edges = numpy.diff(word, prepend = numpy.int8(0), append = numpy.int8(0))
+	return memoryview(numpy.flatnonzero(edges == 1).astype(numpy.int64)), memoryview(numpy.flatnonzero(edges == -1).astype(numpy.int64))
+
+#######################################
+# Token file analysis
+def ascii_chars(atom):
+	"""Returns the set of ASCII characters an atom (a single character regex) matches"""
+	atom = re.compile(atom)
+	return {chr(code) for code in range(128) if atom.fullmatch(chr(code))}
+
+def atoms(node):
+	"""Returns every atom of a regex syntax tree (see dfa_lexer.RegexParser)"""
+	kind = node[0]
+	if kind == "set":
+		return {node[1]}
+	if kind == "eol":
+		return set()
+	if kind in ("group", "star"):
+		return atoms(node[-1])
+	return set().union(*map(atoms, node[1]))
+
+def first_atoms(node):
+	"""Returns the atoms a match of node can start with, and whether node matches the empty string"""
+	kind = node[0]
+	if kind == "set":
+		return {node[1]}, False
+	if kind == "eol":
+		return set(), True
+	if kind in ("group", "star"):
+		first, empty = first_atoms(node[-1])
+		return first, empty or kind == "star"
+	first = set()
+	for item in node[1]:
+		item_first, item_empty = first_atoms(item)
+		first |= item_first
+		if kind == "alt" and item_empty:
+			return first | set().union(*(first_atoms(branch)[0] for branch in node[1])), True
+		if kind == "cat" and not item_empty:
+			return first, False
+	return first, kind == "cat"
+
+def one_char(node):
+	"""True if node always matches one character or $"""
+	kind = node[0]
+	if kind in ("set", "eol"):
+		return True
+	if kind == "group":
+		return one_char(node[2])
+	return (kind == "alt" or len(node[1]) == 1) and all(map(one_char, node[1]))
+
+def first_chars(node):
+	"""Returns the ASCII characters a match of node can start with (all of them if node matches the empty string)"""
+	first, empty = first_atoms(node)
+	return set(map(chr, range(128))) if empty else set().union(*map(ascii_chars, first))
+
+def rule_kind(regex):
+	"""
+	Input:
+	* regex: a rule from the token file
+	Output:
+	* "other" if the rule can never match at an ASCII word character, "word" if it is word local - its
+	  lexeme is made of word characters and it looks at no more than one character (or $) past the lexeme,
+	  like (begin)(\W|$) - and None if the rule is neither, or uses syntax the analysis doesn't know.
+	"""
+	parser = RegexParser(regex)
+	try:
+		node = parser.parse()
+	except LexerError:
+		return None
+	if not first_chars(node) & set(WORD_CHARS):
+		return "other"
+	items = node[1] if node[0] == "cat" else [node]
+	lexeme, context = (items[0], items[1:]) if parser.groups and items and items[0][0] == "group" else (node, [])
+	if all(ascii_chars(atom) <= set(WORD_CHARS) for atom in atoms(lexeme)) and \
+	   (not context or len(context) == 1 and one_char(context[0])):
+		return "word"
+	return None
+
+def rule_first_chars(regex):
+	"""Returns the ASCII characters a rule can start with - all of them if the analysis doesn't know the syntax"""
+	try:
+		return first_chars(RegexParser(regex).parse())
+	except LexerError:
+		return set(map(chr, range(128)))
+
+
+#######################################
+# Lexing
+class VectorRules:
+	"""
+	What the vector engine knows about a token file, shared by every lex of it (see vector_rules).
+	The variable instances for vector rules are:
+	* spec: the LexerSpec
+	* word_local: True if every rule is "word" or "other" (see rule_kind) - otherwise the word runs aren't used
+	* by_char: for every ASCII character, the master regex of the rules that can start with it (see char_rules),
+	  made the first time the character is lexed
+	"""
+
+	def __init__(self, token_file):
+		self.spec = load_spec(token_file)
+		self.word_local = all(rule_kind(regex) for regex in self.spec.regexs)
+		self.first_chars = [rule_first_chars(regex) for regex in self.spec.regexs]
+		self.by_char = [None] * 128
+
+	def dispatch(self, text, pos, endpos):
+		"""Matches at pos like LexerSpec.match, trying only the rules that can start with the character at pos"""
+		code = ord(text[pos])
+		rules = self.by_char[code] if code < 128 else None
+		if rules is None:
+			if code >= 128:
+				return self.spec.match(text, pos, endpos)
+			rules = self.by_char[code] = self.char_rules(chr(code))
+		if not rules: # the string rule can start here - LexerSpec.match knows how to scan it
+			return self.spec.match(text, pos, endpos)
+		master, rule_of_group, lexeme_groups, indices = rules
+		match = master.match(text, pos, endpos)
+		if not match:
+			return None
+		rule = rule_of_group[match.lastindex]
+		start, end = match.span(lexeme_groups[rule])
+		return indices[rule], start, end
+
+	def char_rules(self, char):
+		"""
+		Returns the master regex (see lexer.build_master_regex) of the rules that can start with char, its group
+		maps, and the spec rule index of each of its rules - or () if the string rule can start with char
+		"""
+		indices = [index for index, first in enumerate(self.first_chars) if char in first]
+		if self.spec.string_rule in indices:
+			return ()
+		master, rule_of_group, lexeme_groups = build_master_regex([self.spec.regexs[index] for index in indices] or ["(?!)"])
+		return master, rule_of_group, lexeme_groups, indices
+
+class VectorMatcher:
+	"""
+	A match function (see lexer.scan) for one lex, that looks the tokens at the start of word runs up in its
+	cache and only tries the rules that can start with the character at pos everywhere else. Every lex gets
+	its own matcher (see vector_match), so lexes running at once don't redo each other's pre-pass; they only
+	share the rules. The variable instances for a vector matcher are:
+	* rules: the VectorRules of the token file
+	* word_local: rules.word_local
+	* state: (text, starts, ends) - the text last matched against and the starts and ends of its word runs,
+	  kept in one tuple so a matcher used from two threads never pairs a text with the runs of another
+	* run: cursor into the runs - the first run that doesn't start before the last pos matched at
+	* cache: (rule, lexeme start, lexeme end), relative to the run start, of the match at the start of a run,
+	  keyed by the run and the character after it (nothing at the end of a line) - at most CACHE_SIZE runs
+	"""
+
+	def __init__(self, token_file):
+		self.rules = token_file if isinstance(token_file, VectorRules) else VectorRules(token_file)
+		self.word_local = self.rules.word_local
+		self.state = (None, (), ())
+		self.run = 0
+		self.cache = {}
+
+	def __call__(self, text, pos, endpos):
+		seen, starts, ends = self.state
+		if text is not seen:
+			starts, ends = word_runs(text) if self.word_local else ((), ())
+			self.state = (text, starts, ends)
+			self.run = 0
+		# move the cursor to pos - usually the next run, as the lexer moves forward
+		k = self.run
+		if k < len(starts) and starts[k] < pos:
+			k += 1
+			if k < len(starts) and starts[k] < pos:
+				k = bisect.bisect_left(starts, pos, k)
+		elif k and starts[k - 1] >= pos: # a new scan of the same text
+			k = bisect.bisect_left(starts, pos, 0, k)
+		self.run = k
+		if k == len(starts) or starts[k] != pos:
+			return self.rules.dispatch(text, pos, endpos)
+		end = ends[k]
+		if end > endpos or end < endpos and text[end] > "\x7f":
+			return self.rules.dispatch(text, pos, endpos)
+		key = text[pos:end + 1] if end < endpos else text[pos:end]
+		cache = self.cache
+		found = cache.get(key)
+		if found is None:
+			found = self.rules.dispatch(text, pos, endpos)
+			if found:
+				found = found[0], found[1] - pos, found[2] - pos
+			if len(cache) >= CACHE_SIZE:
+				cache.clear()
+			cache[key] = found or ()
+		return (found[0], pos + found[1], pos + found[2]) if found else None
+
+_rules = {} # the VectorRules of every spec
+
+def vector_rules(spec):
+	"""Returns the VectorRules of a LexerSpec"""
+	rules = _rules.get(spec.digest)
+	if rules is None or rules.spec is not spec:
+		rules = _rules[spec.digest] = VectorRules(spec)
+	return rules
+
+def vector_match(spec):
+	"""Returns a new VectorMatcher for one lex with a LexerSpec"""
+	return VectorMatcher(vector_rules(spec))